@@ -0,0 +1,108 @@
+# coalescer.py
+# Author: Andrew Aberer
+# Collapses bursts of queued controller commands before they run, so three
+# quick swipes cost one request instead of three read-modify-write cycles.
+# Only neighbouring commands of the same kind are merged, so the order of
+# everything else is kept:
+#   additive      volume_up x3             -> volume_up(increment=30)
+#                 brightness_up, _down     -> nothing (they cancel out)
+#   flips         toggle_shuffle x2        -> nothing, x3 -> toggle_shuffle
+#   all-or-none   toggle x3                -> toggle, x4 -> toggle x2
+#   last wins     play, pause, play        -> play
+#   idempotent    add_favorite x2          -> add_favorite
+
+# command -> (quantity, direction, keyword argument, default step)
+ADDITIVE_COMMANDS = {
+    "volume_up": ("volume", 1, "increment", 10),
+    "volume_down": ("volume", -1, "decrement", 10),
+    "brightness_up": ("brightness", 1, "increment", 0.2),
+    "brightness_down": ("brightness", -1, "decrement", 0.2),
+}
+
+# flip one on/off state, so a pair of them cancels out
+TOGGLE_COMMANDS = {"toggle_shuffle"}
+
+# LIFX toggle: if any light is on all go off, otherwise all go on. The
+# first one leaves the lights all on or all off and later ones flip that,
+# so an odd run acts like one toggle and an even run like two (which is not
+# a no-op: lights that were partly on end up all on).
+ALL_OR_NONE_COMMANDS = {"toggle"}
+
+# command -> group whose latest command decides the outcome
+LAST_WINS_COMMANDS = {
+    "play": "playback",
+    "pause": "playback",
+    "lights_on": "power",
+    "lights_off": "power",
+    "set_color_red": "color",
+    "set_color_blue": "color",
+}
+
+IDEMPOTENT_COMMANDS = {"add_favorite"}
+
+
+# kind of merge a command takes part in, or None if it always runs as is
+def merge_key(command):
+    if command in ADDITIVE_COMMANDS:
+        return "add", ADDITIVE_COMMANDS[command][0]
+    if command in TOGGLE_COMMANDS:
+        return "toggle", command
+    if command in ALL_OR_NONE_COMMANDS:
+        return "all_or_none", command
+    if command in LAST_WINS_COMMANDS:
+        return "last", LAST_WINS_COMMANDS[command]
+    if command in IDEMPOTENT_COMMANDS:
+        return "same", command
+    return None
+
+
+# items: queued commands, oldest first, each a dict with "command" and
+# "kwargs". Returns one dict per command to run, oldest first:
+# {"command", "kwargs", "items": the queued commands it stands for}.
+# "command" is None when the items cancel out and nothing needs to run.
+def coalesce(items):
+    merged = []
+    for item in items:
+        key = merge_key(item["command"])
+        if merged and key is not None and merged[-1]["key"] == key:
+            merged[-1]["items"].append(item)
+        else:
+            merged.append({"key": key, "items": [item]})
+
+    return [command for group in merged for command in _reduce(group["key"], group["items"])]
+
+
+# the commands (usually one) a group of mergeable items comes down to
+def _reduce(key, items):
+    last = items[-1]
+    if key is None or len(items) == 1:
+        return [{"command": last["command"], "kwargs": last["kwargs"], "items": items}]
+
+    kind = key[0]
+    if kind == "add":
+        total = 0
+        for item in items:
+            _, sign, arg, default = ADDITIVE_COMMANDS[item["command"]]
+            total += sign * item["kwargs"].get(arg, default)
+        if abs(total) < 1e-9:
+            return [{"command": None, "kwargs": {}, "items": items}]
+        up, down = [command for command, spec in ADDITIVE_COMMANDS.items()
+                    if spec[0] == key[1]]
+        command = up if total > 0 else down
+        step = round(abs(total), 6)
+        return [{"command": command,
+                 "kwargs": {ADDITIVE_COMMANDS[command][2]: step},
+                 "items": items}]
+
+    if kind == "toggle":
+        command = last["command"] if len(items) % 2 else None
+        return [{"command": command, "kwargs": {}, "items": items}]
+
+    if kind == "all_or_none":
+        if len(items) % 2:
+            return [{"command": last["command"], "kwargs": {}, "items": items}]
+        return [{"command": last["command"], "kwargs": {}, "items": items[:-1]},
+                {"command": last["command"], "kwargs": {}, "items": items[-1:]}]
+
+    # last wins / idempotent: only the newest one matters
+    return [{"command": last["command"], "kwargs": last["kwargs"], "items": items}]
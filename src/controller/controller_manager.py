@@ -4,10 +4,13 @@
 import logging
 import sys
 import os
+import threading
+import time
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from controller.lifx_controller import LifxController
 from controller.spotify_controller import SpotifyController
+from controller.dispatcher import CommandDispatcher
 from constants.constants import (
     GESTURE_LIST,
     SPOTIFY_COMMANDS,
@@ -15,111 +18,235 @@ from constants.constants import (
     COMMAND_DESCRIPTIONS,
     ControllerType
 )
+from metrics.metrics import REGISTRY
 
 logger = logging.getLogger(__name__)
 
+# Seconds a controller holds the first command of a burst so the rest can be
+# merged with it. Recognized gestures are already PREDICT_COOLDOWN apart, so
+# by default only commands that queued up behind a slow one are merged.
+COALESCE_WINDOW = 0.0
+
+# Seconds a command waits for its controller to finish starting
+INIT_TIMEOUT = 15.0
+
+# Seconds a command may wait in its controller's queue; older ones are shed
+# (reported as failed with error "shed") rather than run late
+MAX_QUEUE_AGE = 5.0
+
 
 class ControllerManager:
-    def __init__(self):
+    # Controllers start on their own threads, so startup never waits on the
+    # network and Spotify and LIFX set up at the same time. Commands for a
+    # controller that is still starting wait for it (up to INIT_TIMEOUT).
+    # lazy: start each controller on first use instead of right away
+    def __init__(self, lazy=False):
         self.controllers = {}
-        self.active_controller = None
+        self.factories = {
+            ControllerType.SPOTIFY: SpotifyController,
+            ControllerType.LIFX: LifxController
+        }
         self.command_maps = {
             ControllerType.SPOTIFY: SPOTIFY_COMMANDS,
             ControllerType.LIFX: LIFX_COMMANDS
         }
+        # per controller: "pending" (not started), "starting", "ready" or
+        # "failed", and an event set once it has finished starting either way
+        self.status = {controller_type: "pending" for controller_type in self.factories}
+        self.ready = {controller_type: threading.Event() for controller_type in self.factories}
+        self._init_lock = threading.Lock()
 
-        self.spotify_available = self._init_spotify()
-        self.lifx_available = self._init_lifx()
+        # per-controller ordered command queues that coalesce bursts
+        self.dispatcher = CommandDispatcher(self._execute, COALESCE_WINDOW, MAX_QUEUE_AGE)
 
-        # default controller (Spotify if available)
-        if self.spotify_available:
-            self.active_controller = ControllerType.SPOTIFY
-        elif self.lifx_available:
-            self.active_controller = ControllerType.LIFX
+        # default controller (Spotify, or LIFX if Spotify fails to start)
+        self.active_controller = ControllerType.SPOTIFY
 
-    def _init_spotify(self):
-        try:
-            spotify = SpotifyController()
-            logger.info("Spotify controller initialized successfully")
-            self.controllers[ControllerType.SPOTIFY] = spotify
-            return True
-        except Exception as e:
-            logger.error(f"Failed to initialize Spotify controller: {str(e)}")
-            return False
+        if not lazy:
+            for controller_type in self.factories:
+                self.start(controller_type)
+
+    # start a controller in the background unless it already was. One that
+    # has to prompt for a login first (Spotify's first OAuth run) starts on
+    # the calling thread instead, when that is the main thread.
+    def start(self, controller_type):
+        with self._init_lock:
+            if self.status[controller_type] != "pending":
+                return
+            self.status[controller_type] = "starting"
+        needs_login = getattr(self.factories[controller_type], "needs_login", None)
+        if (needs_login is not None and needs_login()
+                and threading.current_thread() is threading.main_thread()):
+            self._init(controller_type)
+            return
+        threading.Thread(target=self._init, args=(controller_type,),
+                         name=f"{controller_type}-init", daemon=True).start()
 
-    def _init_lifx(self):
+    def _init(self, controller_type):
+        start = time.perf_counter()
         try:
-            lifx = LifxController()
-            logger.info("LIFX controller initialized successfully")
-            self.controllers[ControllerType.LIFX] = lifx
-            return True
+            controller = self.factories[controller_type]()
+            self.controllers[controller_type] = controller
+            self.status[controller_type] = "ready"
+            logger.info(f"{controller_type} controller initialized successfully")
         except Exception as e:
-            logger.error(f"Failed to initialize LIFX controller: {str(e)}")
-            return False
+            self.status[controller_type] = "failed"
+            logger.error(f"Failed to initialize {controller_type} controller: {str(e)}")
+            if self.active_controller == controller_type:
+                self.active_controller = next(
+                    (other for other, status in self.status.items() if status != "failed"), None)
+        finally:
+            REGISTRY.observe("controller_init_seconds", time.perf_counter() - start,
+                             controller=controller_type)
+            self.ready[controller_type].set()
+
+    # the controller, once started (starting it if needed and waiting up to
+    # timeout seconds); None if it failed or is not ready in time
+    def get_controller(self, controller_type, timeout=INIT_TIMEOUT):
+        self.start(controller_type)
+        self.ready[controller_type].wait(timeout)
+        return self.controllers.get(controller_type)
+
+    # start every controller and wait until each is ready or failed;
+    # returns the status per controller
+    def wait_ready(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for controller_type in self.factories:
+            self.start(controller_type)
+        for event in self.ready.values():
+            event.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return dict(self.status)
+
+    def is_ready(self, controller_type):
+        return self.status.get(controller_type) == "ready"
+
+    # "available" = not known to have failed (it may still be starting)
+    @property
+    def spotify_available(self):
+        return self.status[ControllerType.SPOTIFY] != "failed"
+
+    @property
+    def lifx_available(self):
+        return self.status[ControllerType.LIFX] != "failed"
 
     def has_available_controllers(self):
         return self.spotify_available or self.lifx_available
 
     def set_active(self, controller_type):
-        if controller_type in self.controllers:
+        if controller_type in self.factories and self.status[controller_type] != "failed":
             self.active_controller = controller_type
+            self.start(controller_type)
             return True
         return False
 
-    def handle_gesture(self, gesture_index):
+    # what a gesture maps to, without running anything:
+    # ("switch", info), ("command", controller type, command) or None
+    def _resolve(self, gesture_index):
         if gesture_index < 0 or gesture_index >= len(GESTURE_LIST):
             logger.warning(f"Invalid gesture index: {gesture_index}")
-            return False, None
+            return None
 
         gesture_name = GESTURE_LIST[gesture_index]
         logger.info(
             f"Processing gesture: {gesture_name} (index: {gesture_index})")
 
-        # Store current controller to detect switches
-        prev_controller = self.active_controller
-
         # Handle controller switching gestures (6 for Spotify, 7 for LIFX)
         if gesture_index == 6:  # One - Switch to Spotify
-            success = self.set_active(ControllerType.SPOTIFY)
-            if success:
-                return True, {"type": "switch", "controller": ControllerType.SPOTIFY}
-            return False, None
+            if self.set_active(ControllerType.SPOTIFY):
+                return "switch", {"type": "switch", "controller": ControllerType.SPOTIFY}
+            return None
         elif gesture_index == 7:  # Two - Switch to LIFX
-            success = self.set_active(ControllerType.LIFX)
-            if success:
-                return True, {"type": "switch", "controller": ControllerType.LIFX}
-            return False, None
+            if self.set_active(ControllerType.LIFX):
+                return "switch", {"type": "switch", "controller": ControllerType.LIFX}
+            return None
 
         # Execute on active controller if available
-        if not self.active_controller or self.active_controller not in self.controllers:
+        if not self.active_controller or self.status[self.active_controller] == "failed":
             logger.warning("No active controller available")
-            return False, None
+            return None
 
         command_map = self.command_maps.get(self.active_controller)
         if not command_map or gesture_index not in command_map:
             logger.warning(
                 f"Gesture {gesture_index} not mapped for {self.active_controller}")
-            return False, None
+            return None
 
-        # Get command and execute
-        controller = self.controllers[self.active_controller]
-        command = command_map[gesture_index]
+        return "command", self.active_controller, command_map[gesture_index]
 
+    # run one command on a controller; True on success
+    # kwargs: command arguments, e.g. increment=30 for coalesced volume_up
+    def _execute(self, controller_type, command, **kwargs):
+        controller = self.get_controller(controller_type)
+        if controller is None:
+            logger.error(f"{controller_type} controller is not available ({self.status[controller_type]})")
+            REGISTRY.inc("controller_errors_total", controller=controller_type)
+            return False
         try:
-            success = controller.execute_command(command)
-            if success:
-                # Get command description
-                description = COMMAND_DESCRIPTIONS.get(command, "")
-                return success, {
-                    "type": "command",
-                    "controller": self.active_controller,
-                    "command": command,
-                    "description": description
-                }
-            return False, None
+            success = controller.execute_command(command, **kwargs)
         except Exception as e:
             logger.error(f"Error executing command {command}: {str(e)}")
+            success = False
+        if not success:
+            REGISTRY.inc("controller_errors_total", controller=controller_type)
+        return success
+
+    def _command_info(self, controller_type, command):
+        return {
+            "type": "command",
+            "controller": controller_type,
+            "command": command,
+            "description": COMMAND_DESCRIPTIONS.get(command, "")
+        }
+
+    # run the gesture's command and wait for it (used by manual control)
+    def handle_gesture(self, gesture_index):
+        resolved = self._resolve(gesture_index)
+        if resolved is None:
+            return False, None
+        if resolved[0] == "switch":
+            return True, resolved[1]
+
+        _, controller_type, command = resolved
+        if self._execute(controller_type, command):
+            return True, self._command_info(controller_type, command)
+        return False, None
+
+    # queue the gesture's command on its controller and return right away.
+    # Controller switches apply immediately: (True, {"type": "switch", ...}).
+    # Commands give (True, {"type": "queued", ...}); their outcome arrives
+    # later as a completion event from poll_completions(), possibly merged
+    # with other queued commands (see coalescer.py).
+    def dispatch_gesture(self, gesture_index):
+        resolved = self._resolve(gesture_index)
+        if resolved is None:
             return False, None
+        if resolved[0] == "switch":
+            return True, resolved[1]
+
+        _, controller_type, command = resolved
+        info = self._command_info(controller_type, command)
+        self.dispatcher.submit(controller_type, command,
+                               dict(info, gesture_index=gesture_index))
+        return True, dict(info, type="queued")
+
+    # finished commands as {"type": "command", ..., "success", "error",
+    # "merged", "cancelled", "shed", "queued_seconds", "run_seconds"}; never blocks
+    # unless timeout is given
+    def poll_completions(self, timeout=None):
+        return self.dispatcher.poll(timeout)
+
+    def shutdown(self, wait=True):
+        self.dispatcher.shutdown(wait)
+        for controller in list(self.controllers.values()):
+            if hasattr(controller, "close"):
+                controller.close()
+
+    # client-side rate-limit budget per ready controller: {"limit", "period",
+    # "remaining", "queued", "shed"} (see rate_limit.py)
+    def rate_budgets(self):
+        return {controller_type: controller.limiter.snapshot()
+                for controller_type, controller in list(self.controllers.items())
+                if getattr(controller, "limiter", None) is not None}
 
     def get_active(self):
         return self.active_controller
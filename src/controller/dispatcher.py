@@ -0,0 +1,182 @@
+# dispatcher.py
+# Author: Andrew Aberer
+# Runs controller commands off the gesture loop. Every controller gets its
+# own worker thread (a lane), so its commands run one at a time in the order
+# the gestures arrived, and a slow Spotify call never holds up a LIFX one.
+# Whatever queued up behind a running command is coalesced (coalescer.py)
+# before it runs. Outcomes come back as completion events the caller polls.
+# A command that waited in the queue longer than max_age is shed instead of
+# run: after a burst the user has moved on, and running a backlog of stale
+# commands would only delay the fresh ones further.
+
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+from controller.coalescer import coalesce
+from metrics.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+class _Lane(threading.Thread):
+    def __init__(self, dispatcher, controller_type):
+        super().__init__(name=f"{controller_type}-commands", daemon=True)
+        self.dispatcher = dispatcher
+        self.controller_type = controller_type
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.running = 0
+        self.stopping = False
+
+    def put(self, item):
+        with self.cond:
+            self.items.append(item)
+            self.cond.notify()
+
+    def pending(self):
+        with self.cond:
+            return len(self.items) + self.running
+
+    def stop(self):
+        with self.cond:
+            self.stopping = True
+            self.items.clear()
+            self.cond.notify()
+
+    # next batch of queued commands; waits up to the debounce window after
+    # the oldest one arrived so a burst can finish queueing
+    def _take(self):
+        window = self.dispatcher.window
+        with self.cond:
+            while not self.items and not self.stopping:
+                self.cond.wait()
+            while window and not self.stopping:
+                remaining = self.items[0]["submitted_at"] + window - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            if self.stopping:
+                return None
+            batch = list(self.items)
+            self.items.clear()
+            self.running = len(batch)
+            return batch
+
+    def run(self):
+        while True:
+            batch = self._take()
+            if batch is None:
+                return
+            for merged in coalesce(batch):
+                if self.stopping:
+                    break
+                self.dispatcher._run(self.controller_type, merged)
+            with self.cond:
+                self.running = 0
+
+
+class CommandDispatcher:
+    # execute(controller_type, command, **kwargs) runs one command and
+    # returns True on success
+    # window: seconds to hold the first command of a burst so later ones
+    #         can be merged with it (0 = only merge what is already queued)
+    # max_age: seconds a command may wait in the queue before it is shed
+    #          (None = never shed)
+    def __init__(self, execute, window=0.0, max_age=None):
+        self.execute = execute
+        self.window = window
+        self.max_age = max_age
+        self._lanes = {}  # controller type -> _Lane
+        self._lock = threading.Lock()
+        self.completions = queue.Queue()
+
+    def _lane(self, controller_type):
+        with self._lock:
+            lane = self._lanes.get(controller_type)
+            if lane is None:
+                lane = self._lanes[controller_type] = _Lane(self, controller_type)
+                lane.start()
+            return lane
+
+    # queue a command behind the controller's earlier ones; `info` is
+    # copied into its completion event
+    def submit(self, controller_type, command, info, **kwargs):
+        self._lane(controller_type).put({
+            "command": command,
+            "kwargs": kwargs,
+            "info": info,
+            "submitted_at": time.perf_counter()
+        })
+
+    # run one coalesced command and report it: one completion event for the
+    # newest gesture it stands for, with "merged" = how many it covers,
+    # "cancelled" = True if they cancelled out and nothing was sent, and
+    # "shed" = True if even the newest one was queued longer than max_age
+    def _run(self, controller_type, merged):
+        items = merged["items"]
+        command = merged["command"]
+        started_at = time.perf_counter()
+        success, error = True, None
+        shed = (self.max_age is not None and command is not None
+                and started_at - items[-1]["submitted_at"] > self.max_age)
+        if shed:
+            success, error = False, "shed"
+            REGISTRY.inc("dispatcher_shed_total", len(items), controller=controller_type)
+            logger.warning(f"Shed {len(items)} {controller_type} {command} commands "
+                           f"queued over {self.max_age:.0f}s")
+        elif command is not None:
+            try:
+                success = bool(self.execute(controller_type, command, **merged["kwargs"]))
+            except Exception as e:
+                success, error = False, str(e)
+                logger.error(f"Error executing {controller_type} command {command}: {error}")
+        elif len(items) > 1:
+            logger.info(f"{len(items)} queued {controller_type} commands cancelled out")
+
+        finished_at = time.perf_counter()
+        self.completions.put(dict(
+            items[-1]["info"],
+            command=command if command is not None else items[-1]["command"],
+            kwargs=merged["kwargs"],
+            merged=len(items),
+            cancelled=command is None,
+            shed=shed,
+            success=success,
+            error=error,
+            queued_seconds=started_at - items[0]["submitted_at"],
+            run_seconds=finished_at - started_at
+        ))
+
+    # completion events that are ready, without waiting (or waiting up to
+    # timeout seconds for the first one)
+    def poll(self, timeout=None):
+        completions = []
+        try:
+            if timeout:
+                completions.append(self.completions.get(timeout=timeout))
+            while True:
+                completions.append(self.completions.get_nowait())
+        except queue.Empty:
+            pass
+        return completions
+
+    # commands queued or running, for one controller or all of them
+    def pending(self, controller_type=None):
+        with self._lock:
+            lanes = list(self._lanes.items())
+        return sum(lane.pending() for lane_type, lane in lanes
+                   if controller_type is None or lane_type == controller_type)
+
+    # drop queued commands and stop the lanes (wait=True blocks until the
+    # running commands are done)
+    def shutdown(self, wait=True):
+        with self._lock:
+            lanes = list(self._lanes.values())
+        for lane in lanes:
+            lane.stop()
+        if wait:
+            for lane in lanes:
+                lane.join()
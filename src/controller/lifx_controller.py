@@ -2,41 +2,98 @@
 # Author: Andrew Aberer
 
 import requests
+from requests.adapters import HTTPAdapter
 import os
 import logging
+import threading
 import time
 import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from typing import Dict, Any, List, Optional
 from constants.constants import LIFX_COMMANDS
+from metrics.metrics import http_hook
+from controller.lifx_lan import LifxLan, parse_color
+from controller.resilience import Resilience
+from controller.rate_limit import RateLimiter, RateLimitedAdapter, background_calls
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+LIFX_API_URL = "https://api.lifx.com/v1/lights"
+CONNECT_TIMEOUT = 3.05  # seconds to open a connection
+READ_TIMEOUT = 5.0      # seconds to wait for a response
+POOL_SIZE = 4           # keep-alive connections held open to the API
+STATE_TTL = 30.0        # seconds the cached light state is used as is
+STATE_MAX_AGE = 300.0   # older than this, fetch the state before acting on it
+DEFAULT_KELVIN = 3500   # white point assumed for a light whose colour is unknown
+
 
 class LifxController:
     # init LIFX controller with API token.
-    def __init__(self):
+    # api_url: overrides LIFX_API_URL / the LIFX_API_URL env var (e.g. a local stand-in)
+    # session: requests.Session to use instead of a new pooled (and
+    #          rate-limited) one
+    # timeout: (connect, read) seconds for every request
+    # transport: "cloud" (api.lifx.com) or "lan" (UDP straight to the bulbs,
+    #            see lifx_lan.py); defaults to the LIFX_TRANSPORT env var
+    # lan: LifxLan client to use instead of a new one
+    def __init__(self, api_url: Optional[str] = None,
+                 session: Optional[requests.Session] = None,
+                 timeout: tuple = (CONNECT_TIMEOUT, READ_TIMEOUT),
+                 transport: Optional[str] = None,
+                 lan: Optional[LifxLan] = None):
         try:
+            self.transport = (transport or os.environ.get('LIFX_TRANSPORT') or "cloud").lower()
+            if self.transport not in ("cloud", "lan"):
+                raise ValueError(f"Unknown LIFX transport: {self.transport}")
+
             # API token - set these env vars in your zshrc/bashrc or similar
             self.api_token = os.environ.get('LIFX_API_TOKEN')
 
-            if not self.api_token:
+            if not self.api_token and self.transport == "cloud":
                 logger.error(
                     "Missing LIFX API token. Please set LIFX_API_TOKEN environment variable.")
                 raise ValueError(
                     "LIFX API token not found in environment variables")
 
-            self.api_url = "https://api.lifx.com/v1/lights"
+            self.api_url = api_url or os.environ.get('LIFX_API_URL', LIFX_API_URL)
             self.headers = {
                 "Authorization": f"Bearer {self.api_token}",
                 "Content-Type": "application/json"
             }
-
-            # test connection by getting avail. lights
-            self.get_lights()
+            self.timeout = timeout
+
+            # local copy of the lights, filled by get_lights() and updated
+            # optimistically by every successful state change
+            self.state_ttl = STATE_TTL
+            self._lights: Optional[List[Dict[str, Any]]] = None
+            self._lights_at: Optional[float] = None  # None: never fetched, or invalidated
+            self._state_lock = threading.Lock()
+            self._fetch_lock = threading.Lock()  # one full state fetch at a time
+            self._refreshing = False
+
+            # client-side budget for the cloud API's 120 requests / minute
+            self.limiter = RateLimiter.for_backend("lifx")
+
+            # one pooled keep-alive session, so commands reuse a warm
+            # TCP/TLS connection instead of opening a new one each time
+            self.session = session or self._create_session()
+            self.session.headers.update(self.headers)
+            self.session.hooks["response"].append(http_hook("lifx"))  # request time / status metrics
+
+            # LAN transport: bulbs found by broadcast, commands sent over UDP
+            self.lan = None
+            if self.transport == "lan":
+                self.lan = lan or LifxLan()
+
+            # retries, Retry-After and a circuit breaker around every call
+            self.resilience = Resilience("lifx", probe=self._probe)
+
+            # fetch the lights in the background, so startup never waits
+            # on the network; the first command fetches them if this fails
+            self._refresh_in_background()
             logger.info("LIFX controller initialized successfully")
 
         except Exception as e:
@@ -44,7 +101,7 @@ class LifxController:
             raise
 
     # execute LIFX command based on the input string
-    def execute_command(self, command: str) -> bool:
+    def execute_command(self, command: str, **kwargs) -> bool:
         logger.info(f"Executing LIFX command: {command}")
 
         command_map = {
@@ -59,7 +116,7 @@ class LifxController:
 
         if command in command_map:
             try:
-                command_map[command]()
+                command_map[command](**kwargs)
                 return True
             except Exception as e:
                 logger.error(f"Error executing command '{command}': {str(e)}")
@@ -68,19 +125,192 @@ class LifxController:
             logger.warning(f"Unknown command: {command}")
             return False
 
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        if self.limiter is not None:
+            adapter = RateLimitedAdapter(self.limiter, pool_connections=1, pool_maxsize=POOL_SIZE)
+        else:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    # send one request to the API (path is relative to api_url) and raise
+    # for error statuses; retried unless it is a POST (toggle)
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        def send():
+            response = self.session.request(method, self.api_url + path,
+                                            timeout=self.timeout, **kwargs)
+            response.raise_for_status()
+            return response
+
+        return self.resilience.call(send, idempotent=method != "POST")
+
+    # call the LAN client through the circuit breaker (it resends on its own)
+    def _lan_call(self, fn, *args):
+        return self.resilience.call(fn, *args, attempts=1)
+
+    # raises while the backend is unreachable; the circuit breaker runs this
+    # in the background to find out when it is back
+    def _probe(self) -> None:
+        if self.lan is not None:
+            if not self.lan.discover():
+                raise TimeoutError("No LIFX bulbs found on the LAN")
+            return
+        with background_calls():
+            response = self.session.get(self.api_url + "/all", timeout=self.timeout)
+        response.raise_for_status()
+
+    # release the pooled connections (and the LAN socket)
+    def close(self) -> None:
+        self.resilience.close()
+        self.session.close()
+        if self.lan is not None:
+            self.lan.close()
+
     # get all LIFX lights associated with the account
     def get_lights(self) -> List[Dict[str, Any]]:
         try:
-            response = requests.get(
-                self.api_url + "/all", headers=self.headers)
-            response.raise_for_status()
-            lights = response.json()
+            if self.lan is not None:
+                lights = self._lan_call(self.lan.get_lights)
+            else:
+                lights = self._request("GET", "/all").json()
+            with self._state_lock:
+                self._lights = [dict(light) for light in lights]
+                self._lights_at = time.monotonic()
             logger.info(f"Found {len(lights)} LIFX lights")
             return lights
         except Exception as e:
             logger.error(f"Failed to get lights: {str(e)}")
             raise
 
+    # lights matching selector from the cache. Within state_ttl the cache
+    # is used as is; older (up to STATE_MAX_AGE) it is still used, but a
+    # refresh starts in the background; with no usable cache, fetch now.
+    def cached_lights(self, selector: str = "all") -> List[Dict[str, Any]]:
+        with self._state_lock:
+            age = self._cache_age()
+            lights = self._lights if age <= STATE_MAX_AGE else None
+            stale = lights is not None and age > self.state_ttl
+        if lights is None:
+            with self._fetch_lock:
+                # a fetch already in flight (e.g. the one started at init)
+                # may have filled the cache while this one waited; if it
+                # failed, the cache is still empty and this one fetches
+                with self._state_lock:
+                    age = self._cache_age()
+                if age > STATE_MAX_AGE:
+                    self.get_lights()
+        elif stale:
+            self._refresh_in_background()
+        with self._state_lock:
+            return [dict(light) for light in self._select(self._lights, selector)]
+
+    def _refresh_in_background(self) -> None:
+        with self._state_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                with self._fetch_lock, background_calls():
+                    self.get_lights()
+            except Exception:
+                pass  # already logged; the cache stays as it was
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, name="lifx-refresh", daemon=True).start()
+
+    # seconds since the cache was filled; infinite when it never was, or
+    # was invalidated since (call with _state_lock held)
+    def _cache_age(self) -> float:
+        if self._lights is None or self._lights_at is None:
+            return float("inf")
+        return time.monotonic() - self._lights_at
+
+    # forget the cached state (e.g. after a failed command)
+    def invalidate_cache(self) -> None:
+        with self._state_lock:
+            self._lights_at = None
+
+    # cached lights a LIFX selector ("all", "id:...", "label:...") refers to
+    @staticmethod
+    def _select(lights: List[Dict[str, Any]], selector: str) -> List[Dict[str, Any]]:
+        if selector == "all":
+            return lights
+        kind, _, value = selector.partition(":")
+        return [light for light in lights if light.get(kind) == value]
+
+    # PUT a state change and apply it to the cache once the API accepted it
+    def _put_state(self, selector: str, data: Dict[str, Any]) -> None:
+        try:
+            if self.lan is not None:
+                self._lan_call(self.lan.set_state, selector, data)
+            else:
+                self._request("PUT", f"/{selector}/state", json=data)
+        except Exception:
+            self.invalidate_cache()
+            raise
+        with self._state_lock:
+            for light in self._select(self._lights or [], selector):
+                self._apply_state(light, data)
+
+    # copy the keys of a state change that the cache keeps onto a cached light;
+    # a colour ("red", "hue:120 saturation:1.0") is stored the way the API
+    # returns it, as {"hue", "saturation", "kelvin"}
+    @staticmethod
+    def _apply_state(light: Dict[str, Any], data: Dict[str, Any]) -> None:
+        for key in ("power", "brightness"):
+            if key in data:
+                light[key] = data[key]
+        if "color" in data:
+            kelvin = (light.get("color") or {}).get("kelvin", DEFAULT_KELVIN)
+            hue, saturation, kelvin = parse_color(data["color"], kelvin)
+            light["color"] = {"hue": hue, "saturation": saturation, "kelvin": kelvin}
+
+    # apply several state changes in one request (PUT /lights/states), e.g.
+    # a scene with different settings per room
+    # args:
+    #     states: list of {"selector": ..., "power"/"brightness"/"color"/"duration": ...}
+    #     defaults: keys used by every state that does not set them itself
+    # returns: one {"operation": state, "results": [{"id", "label", "status"}]}
+    #          per state; lights whose status is not "ok" did not change
+    def set_states(self, states: List[Dict[str, Any]],
+                   defaults: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        try:
+            try:
+                if self.lan is not None:
+                    results = self._lan_call(self.lan.set_states, states, defaults)
+                else:
+                    data = {"states": states}
+                    if defaults:
+                        data["defaults"] = defaults
+                    results = self._request("PUT", "/states", json=data).json()["results"]
+            except Exception:
+                self.invalidate_cache()
+                raise
+
+            failed = 0
+            with self._state_lock:
+                cached = {light["id"]: light for light in self._lights or []}
+                for result in results:
+                    operation = dict(defaults or {}, **result["operation"])
+                    for light in result["results"]:
+                        if light.get("status") != "ok":
+                            failed += 1
+                        elif light["id"] in cached:
+                            self._apply_state(cached[light["id"]], operation)
+            if failed:
+                self.invalidate_cache()  # those lights may be in any state now
+                logger.warning(f"{failed} lights did not take their new state")
+            logger.info(f"Set {len(states)} light states")
+            return results
+        except Exception as e:
+            logger.error(f"Failed to set light states: {str(e)}")
+            raise
+
     # get current state of all lights
     def get_light_states(self) -> Dict[str, Any]:
         try:
@@ -103,12 +333,7 @@ class LifxController:
     def turn_on(self, selector: str = "all") -> None:
         try:
             data = {"power": "on"}
-            response = requests.put(
-                f"{self.api_url}/{selector}/state",
-                headers=self.headers,
-                json=data
-            )
-            response.raise_for_status()
+            self._put_state(selector, data)
             logger.info(f"Turned on lights: {selector}")
         except Exception as e:
             logger.error(f"Failed to turn on lights: {str(e)}")
@@ -118,12 +343,7 @@ class LifxController:
     def turn_off(self, selector: str = "all") -> None:
         try:
             data = {"power": "off"}
-            response = requests.put(
-                f"{self.api_url}/{selector}/state",
-                headers=self.headers,
-                json=data
-            )
-            response.raise_for_status()
+            self._put_state(selector, data)
             logger.info(f"Turned off lights: {selector}")
         except Exception as e:
             logger.error(f"Failed to turn off lights: {str(e)}")
@@ -132,11 +352,24 @@ class LifxController:
     # toggle state of all lights or a specific light
     def toggle(self, selector: str = "all") -> None:
         try:
-            response = requests.post(
-                f"{self.api_url}/{selector}/toggle",
-                headers=self.headers
-            )
-            response.raise_for_status()
+            try:
+                if self.lan is not None:
+                    self._lan_call(self.lan.toggle, selector)
+                else:
+                    self._request("POST", f"/{selector}/toggle")
+            except Exception:
+                self.invalidate_cache()
+                raise
+            with self._state_lock:
+                lights = self._select(self._lights or [], selector)
+                # the API's rule: if any of the lights is on, all go off,
+                # otherwise all go on (the LAN client knows the outcome)
+                power = "off" if any(light["power"] == "on" for light in lights) else "on"
+                for light in lights:
+                    if self.lan is not None:
+                        light["power"] = self.lan.lights.get(bytes.fromhex(light["id"]), light)["power"]
+                    else:
+                        light["power"] = power
             logger.info(f"Toggled lights: {selector}")
         except Exception as e:
             logger.error(f"Failed to toggle lights: {str(e)}")
@@ -157,12 +390,7 @@ class LifxController:
                 "duration": duration
             }
 
-            response = requests.put(
-                f"{self.api_url}/{selector}/state",
-                headers=self.headers,
-                json=data
-            )
-            response.raise_for_status()
+            self._put_state(selector, data)
             logger.info(
                 f"Set brightness to {brightness:.2f} for lights: {selector}")
         except Exception as e:
@@ -172,14 +400,15 @@ class LifxController:
     # increase brightness by increment (capped at 1.0)
     def brightness_up(self, increment: float = 0.2, selector: str = "all") -> None:
         try:
-            # current light states and only powered-on lights
-            lights = self.get_lights()
+            # cached light states and only powered-on lights, so a swipe
+            # is a single request and quick repeats build on each other
+            lights = self.cached_lights(selector)
             on_lights = [light for light in lights if light["power"] == "on"]
 
             if not on_lights:
                 # if no lights are on, turn them on at low brightness
-                self.turn_on(selector)
-                self.set_brightness(increment, selector)
+                self._put_state(selector, {"power": "on", "brightness": increment})
+                logger.info(f"Turned on lights at {increment:.2f}: {selector}")
                 return
 
             avg_brightness = sum(light["brightness"]
@@ -195,8 +424,8 @@ class LifxController:
     # decrease brightness by decrement (minimum 0.1)
     def brightness_down(self, decrement: float = 0.2, selector: str = "all") -> None:
         try:
-            # current light states and only powered-on lights
-            lights = self.get_lights()
+            # cached light states and only powered-on lights
+            lights = self.cached_lights(selector)
             on_lights = [light for light in lights if light["power"] == "on"]
 
             if not on_lights:
@@ -237,12 +466,7 @@ class LifxController:
                 "duration": duration
             }
 
-            response = requests.put(
-                f"{self.api_url}/{selector}/state",
-                headers=self.headers,
-                json=data
-            )
-            response.raise_for_status()
+            self._put_state(selector, data)
             logger.info(f"Set color to {color} for lights: {selector}")
         except Exception as e:
             logger.error(f"Failed to set color: {str(e)}")
@@ -0,0 +1,342 @@
+# lifx_lan.py
+# Author: Andrew Aberer
+# LIFX LAN protocol client: talks to the bulbs directly over UDP (port 56700)
+# instead of going through api.lifx.com, so a command costs one LAN round
+# trip and is not subject to the cloud rate limit. Used by LifxController
+# when LIFX_TRANSPORT=lan.
+#
+# Bulbs are found by broadcasting GetService; the replies (and each bulb's
+# LightState) are kept in a device table that is reused until DEVICE_TTL
+# runs out or a bulb stops answering. Lights are described in the same shape
+# as the cloud API returns them (id, label, power, brightness, color), so the
+# controller's cache works the same with either transport.
+#
+# Protocol reference: https://lan.developer.lifx.com/docs/
+
+import logging
+import os
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from typing import Dict, Any, List, Optional, Tuple
+from metrics.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+LAN_PORT = 56700
+BROADCAST_ADDRESS = "255.255.255.255"
+DISCOVERY_TIMEOUT = 0.5  # seconds to collect GetService replies
+ACK_TIMEOUT = 0.25       # seconds to wait for a reply before resending
+RETRIES = 3              # sends per message before giving up
+DEVICE_TTL = 300.0       # seconds before the device table is rediscovered
+
+# message types used here
+GET_SERVICE = 2
+STATE_SERVICE = 3
+ACKNOWLEDGEMENT = 45
+LIGHT_GET = 101
+LIGHT_SET_COLOR = 102
+LIGHT_STATE = 107
+LIGHT_SET_POWER = 117
+
+SERVICE_UDP = 1
+
+# frame header (8) + frame address (16) + protocol header (12)
+HEADER = struct.Struct("<HHI8s6sBBQHH")
+STATE_SERVICE_PAYLOAD = struct.Struct("<BI")
+LIGHT_STATE_PAYLOAD = struct.Struct("<HHHHhH32sQ")
+SET_COLOR_PAYLOAD = struct.Struct("<BHHHHI")
+SET_POWER_PAYLOAD = struct.Struct("<HI")
+
+PROTOCOL = 1024
+ADDRESSABLE = 1 << 12
+TAGGED = 1 << 13
+RES_REQUIRED = 1
+ACK_REQUIRED = 2
+
+# colour names the gestures use, as (hue degrees, saturation)
+COLOR_NAMES = {
+    "red": (0.0, 1.0),
+    "orange": (36.0, 1.0),
+    "yellow": (60.0, 1.0),
+    "green": (120.0, 1.0),
+    "cyan": (180.0, 1.0),
+    "blue": (250.0, 1.0),
+    "purple": (280.0, 1.0),
+    "pink": (325.0, 1.0),
+    "white": (0.0, 0.0),
+}
+
+
+# one packet: header + payload. target is the bulb's 6-byte serial
+# (None = every bulb, for discovery)
+def pack_message(msg_type: int, payload: bytes = b"", source: int = 0,
+                 target: Optional[bytes] = None, sequence: int = 0, flags: int = 0) -> bytes:
+    tagged = TAGGED if target is None else 0
+    return HEADER.pack(HEADER.size + len(payload), PROTOCOL | ADDRESSABLE | tagged, source,
+                       (target or b"").ljust(8, b"\0"), b"\0" * 6, flags, sequence,
+                       0, msg_type, 0) + payload
+
+
+# (msg_type, source, target serial, sequence, flags, payload) of one packet
+def unpack_message(data: bytes) -> Tuple[int, int, bytes, int, int, bytes]:
+    size, _, source, target, _, flags, sequence, _, msg_type, _ = HEADER.unpack_from(data)
+    return msg_type, source, target[:6], sequence, flags, data[HEADER.size:size]
+
+
+# HSBK words <-> the cloud API's hue degrees / 0..1 fractions
+def to_hsbk(hue: float, saturation: float, brightness: float, kelvin: int) -> Tuple[int, int, int, int]:
+    return (int(round(hue % 360 / 360 * 65535)) % 65536,
+            int(round(max(0.0, min(1.0, saturation)) * 65535)),
+            int(round(max(0.0, min(1.0, brightness)) * 65535)),
+            int(kelvin))
+
+
+def from_light_state(serial: bytes, payload: bytes) -> Dict[str, Any]:
+    hue, saturation, brightness, kelvin, _, power, label, _ = LIGHT_STATE_PAYLOAD.unpack(payload)
+    return {
+        "id": serial.hex(),
+        "label": label.rstrip(b"\0").decode(errors="replace"),
+        "power": "on" if power else "off",
+        "brightness": brightness / 65535,
+        "color": {"hue": hue / 65535 * 360, "saturation": saturation / 65535, "kelvin": kelvin},
+        "connected": True
+    }
+
+
+# (hue, saturation, kelvin or None) for a colour name, a cloud-style string
+# ("hue:120 saturation:1.0 kelvin:3500") or a {"hue", "saturation"} dict
+def parse_color(color, kelvin: int) -> Tuple[float, float, int]:
+    if isinstance(color, dict):
+        return (color.get("hue", 0.0), color.get("saturation", 0.0),
+                color.get("kelvin", kelvin))
+    if color.lower() in COLOR_NAMES:
+        hue, saturation = COLOR_NAMES[color.lower()]
+        return hue, saturation, kelvin
+    fields = dict(part.split(":", 1) for part in color.split() if ":" in part)
+    return (float(fields.get("hue", 0.0)), float(fields.get("saturation", 0.0)),
+            int(fields.get("kelvin", kelvin)))
+
+
+class LifxLan:
+    # broadcast: "host[:port]" discovery is sent to (or the
+    #            LIFX_LAN_BROADCAST env var), e.g. 127.0.0.1:56700 for the emulator
+    def __init__(self, broadcast: Optional[str] = None, timeout: float = ACK_TIMEOUT,
+                 retries: int = RETRIES, discovery_timeout: float = DISCOVERY_TIMEOUT,
+                 device_ttl: float = DEVICE_TTL):
+        broadcast = broadcast or os.environ.get('LIFX_LAN_BROADCAST', BROADCAST_ADDRESS)
+        host, _, port = broadcast.partition(":")
+        self.broadcast = (host, int(port or LAN_PORT))
+        self.timeout = timeout
+        self.retries = retries
+        self.discovery_timeout = discovery_timeout
+        self.device_ttl = device_ttl
+
+        self.source = random.randint(2, 0xFFFFFFFF)  # tags our replies
+        self._sequence = 0
+        self._lock = threading.Lock()  # one exchange on the socket at a time
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.sock.bind(("", 0))
+
+        # device table: serial -> (ip, port) and serial -> light dict
+        self.addresses: Dict[bytes, Tuple[str, int]] = {}
+        self.lights: Dict[bytes, Dict[str, Any]] = {}
+        self._discovered_at: Optional[float] = None  # None: rediscover before the next use
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def _next_sequence(self) -> int:
+        self._sequence = (self._sequence + 1) % 256
+        return self._sequence
+
+    # replies to every packet in `messages` [(serial, msg_type, payload, reply_type)],
+    # sent together and resent until answered. Returns {index: reply payload};
+    # raises TimeoutError if a bulb never answers (strict=False leaves its
+    # messages out of the result instead).
+    def _exchange(self, messages: List[Tuple[bytes, int, bytes, int]],
+                  strict: bool = True) -> Dict[int, bytes]:
+        if len(messages) > 255:  # sequence numbers are one byte
+            replies = {}
+            for first in range(0, len(messages), 255):
+                chunk = self._exchange(messages[first:first + 255], strict)
+                replies.update({first + i: reply for i, reply in chunk.items()})
+            return replies
+
+        start = time.perf_counter()
+        with self._lock:
+            pending = {}  # sequence -> (index, serial, packet, reply_type)
+            for index, (serial, msg_type, payload, reply_type) in enumerate(messages):
+                sequence = self._next_sequence()
+                flags = ACK_REQUIRED if reply_type == ACKNOWLEDGEMENT else RES_REQUIRED
+                packet = pack_message(msg_type, payload, self.source, serial, sequence, flags)
+                pending[sequence] = (index, serial, packet, reply_type)
+
+            replies = {}
+            for _ in range(self.retries):
+                for _, serial, packet, _ in pending.values():
+                    self.sock.sendto(packet, self.addresses[serial])
+                deadline = time.monotonic() + self.timeout
+                while pending and time.monotonic() < deadline:
+                    self.sock.settimeout(max(0.0, deadline - time.monotonic()))
+                    try:
+                        data, _ = self.sock.recvfrom(1024)
+                    except socket.timeout:
+                        break
+                    msg_type, source, _, sequence, _, payload = unpack_message(data)
+                    item = pending.get(sequence)
+                    if source != self.source or item is None or msg_type != item[3]:
+                        continue  # a late reply to an earlier try
+                    replies[item[0]] = payload
+                    del pending[sequence]
+                if not pending:
+                    break
+
+        REGISTRY.observe("lifx_lan_exchange_seconds", time.perf_counter() - start)
+        if pending:
+            self._discovered_at = None  # a bulb went away or changed address
+            if not strict:
+                return replies
+            missing = sorted({serial.hex() for _, serial, _, _ in pending.values()})
+            raise TimeoutError(f"No reply from LIFX bulb(s): {', '.join(missing)}")
+        return replies
+
+    # broadcast GetService and rebuild the device table from the replies
+    def discover(self) -> List[Dict[str, Any]]:
+        addresses = {}
+        with self._lock:
+            sequence = self._next_sequence()
+            packet = pack_message(GET_SERVICE, source=self.source, sequence=sequence,
+                                  flags=RES_REQUIRED)
+            self.sock.sendto(packet, self.broadcast)
+            deadline = time.monotonic() + self.discovery_timeout
+            while time.monotonic() < deadline:
+                self.sock.settimeout(max(0.0, deadline - time.monotonic()))
+                try:
+                    data, (ip, _) = self.sock.recvfrom(1024)
+                except socket.timeout:
+                    break
+                msg_type, source, serial, _, _, payload = unpack_message(data)
+                if msg_type != STATE_SERVICE or source != self.source:
+                    continue
+                service, port = STATE_SERVICE_PAYLOAD.unpack(payload)
+                if service == SERVICE_UDP:
+                    addresses[serial] = (ip, port)
+
+        self.addresses = addresses
+        self.lights = {}
+        self._discovered_at = time.monotonic()
+        logger.info(f"Discovered {len(addresses)} LIFX bulbs on the LAN")
+        return self.refresh()
+
+    # True when the device table is empty, too old or known to be wrong
+    def _needs_discovery(self) -> bool:
+        return (not self.addresses or self._discovered_at is None
+                or time.monotonic() - self._discovered_at > self.device_ttl)
+
+    # devices from the table, rediscovering when it is empty or too old
+    def devices(self) -> Dict[bytes, Tuple[str, int]]:
+        if self._needs_discovery():
+            self.discover()
+        return self.addresses
+
+    # ask every known bulb for its LightState and update the table
+    def refresh(self) -> List[Dict[str, Any]]:
+        serials = list(self.addresses)
+        replies = self._exchange([(serial, LIGHT_GET, b"", LIGHT_STATE) for serial in serials])
+        self.lights = {serial: from_light_state(serial, replies[i])
+                       for i, serial in enumerate(serials)}
+        return [dict(light) for light in self.lights.values()]
+
+    # all lights in the cloud API's format
+    def get_lights(self) -> List[Dict[str, Any]]:
+        if self._needs_discovery():
+            return self.discover()
+        return self.refresh()
+
+    # serials a cloud-style selector ("all", "id:...", "label:...") refers to
+    def select(self, selector: str) -> List[bytes]:
+        self.devices()
+        if selector == "all":
+            return list(self.addresses)
+        kind, _, value = selector.partition(":")
+        return [serial for serial, light in self.lights.items() if light.get(kind) == value]
+
+    # SetColor / SetLightPower messages for one bulb taking the state
+    # (power, brightness, color, duration in seconds), each with the table
+    # update to make once it is acknowledged
+    def _state_messages(self, serial: bytes, data: Dict[str, Any]) -> List[Tuple[tuple, dict]]:
+        light = self.lights[serial]
+        duration = int(data.get("duration", 0) * 1000)
+        messages = []
+        if "color" in data or "brightness" in data:
+            current = light["color"]
+            hue, saturation, kelvin = parse_color(data.get("color", current), current["kelvin"])
+            brightness = data.get("brightness", light["brightness"])
+            payload = SET_COLOR_PAYLOAD.pack(0, *to_hsbk(hue, saturation, brightness, kelvin),
+                                             duration)
+            messages.append(((serial, LIGHT_SET_COLOR, payload, ACKNOWLEDGEMENT), {
+                "brightness": brightness,
+                "color": {"hue": hue, "saturation": saturation, "kelvin": kelvin}}))
+        if "power" in data:
+            level = 65535 if data["power"] == "on" else 0
+            messages.append(((serial, LIGHT_SET_POWER, SET_POWER_PAYLOAD.pack(level, duration),
+                              ACKNOWLEDGEMENT), {"power": data["power"]}))
+        return messages
+
+    # the cloud API's PUT /lights/{selector}/state: power, brightness,
+    # color and duration (seconds), one SetColor / SetLightPower per bulb
+    def set_state(self, selector: str, data: Dict[str, Any]) -> None:
+        messages = [message for serial in self.select(selector)
+                    for message in self._state_messages(serial, data)]
+        self._exchange([packet for packet, _ in messages])
+        for (serial, *_), update in messages:
+            self.lights[serial].update(update)
+
+    # the cloud API's PUT /lights/states: every operation's messages go out
+    # in one exchange. Returns the same per-light results the cloud does,
+    # status "timed_out" for bulbs that never acknowledged.
+    def set_states(self, states: List[Dict[str, Any]],
+                   defaults: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        operations = []  # (operation, [(serial, [message indices])])
+        messages = []
+        for state in states:
+            operation = dict(defaults or {}, **state)
+            targets = []
+            for serial in self.select(operation.get("selector", "all")):
+                first = len(messages)
+                messages.extend(self._state_messages(serial, operation))
+                targets.append((serial, range(first, len(messages))))
+            operations.append((state, targets))
+
+        replies = self._exchange([packet for packet, _ in messages], strict=False)
+        results = []
+        for state, targets in operations:
+            lights = []
+            for serial, indices in targets:
+                ok = all(i in replies for i in indices)
+                if ok:
+                    for i in indices:
+                        self.lights[serial].update(messages[i][1])
+                lights.append({"id": serial.hex(), "label": self.lights[serial]["label"],
+                               "status": "ok" if ok else "timed_out"})
+            results.append({"operation": state, "results": lights})
+        return results
+
+    # the cloud API's POST /lights/{selector}/toggle: any light on turns
+    # them all off, otherwise they all turn on
+    def toggle(self, selector: str = "all", duration: float = 0.0) -> None:
+        serials = self.select(selector)
+        any_on = any(self.lights[serial]["power"] == "on" for serial in serials)
+        level = 0 if any_on else 65535
+        payload = SET_POWER_PAYLOAD.pack(level, int(duration * 1000))
+        self._exchange([(serial, LIGHT_SET_POWER, payload, ACKNOWLEDGEMENT)
+                        for serial in serials])
+        for serial in serials:
+            self.lights[serial]["power"] = "off" if any_on else "on"
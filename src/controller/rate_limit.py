@@ -0,0 +1,171 @@
+# rate_limit.py
+# Author: Andrew Aberer
+# Client-side rate limiting for the controllers' HTTP APIs. Each backend gets
+# a token bucket sized to its API limit, and every request through the
+# controller's session takes a token first (RateLimitedAdapter), so we slow
+# down before the API starts answering 429.
+#
+# Requests have a priority. Commands (what the user is waiting for) may queue
+# up to MAX_COMMAND_WAIT for a token and are shed (RateLimitedError) if they
+# would wait longer. Background requests (state refreshes, now-playing
+# lookups, circuit-breaker probes; see background_calls()) never wait, never
+# go ahead of a queued command, and leave BACKGROUND_RESERVE of the bucket
+# for commands; otherwise they are shed.
+
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from requests.adapters import HTTPAdapter
+from controller.resilience import RateLimitedError, retry_after
+from metrics.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# backend -> (requests, per seconds); override with e.g. LIFX_RATE_LIMIT=120/60
+# or SPOTIFY_RATE_LIMIT=off
+RATE_LIMITS = {
+    "lifx": (120, 60.0),     # documented: 120 requests per 60 s per token
+    "spotify": (90, 30.0),   # undocumented rolling 30 s window; stays under it
+}
+MAX_COMMAND_WAIT = 2.0      # seconds a command may queue for a token
+BACKGROUND_RESERVE = 0.25   # share of the bucket background requests leave alone
+
+COMMAND = "command"
+BACKGROUND = "background"
+
+_priority = threading.local()
+
+
+# run the requests made inside the block at background priority
+@contextmanager
+def background_calls():
+    previous = getattr(_priority, "value", COMMAND)
+    _priority.value = BACKGROUND
+    try:
+        yield
+    finally:
+        _priority.value = previous
+
+
+def current_priority():
+    return getattr(_priority, "value", COMMAND)
+
+
+class RateLimiter:
+    # limit requests per period seconds, all of which may be used at once
+    def __init__(self, name, limit, period, max_wait=MAX_COMMAND_WAIT,
+                 reserve=BACKGROUND_RESERVE):
+        self.name = name
+        self.limit = limit
+        self.period = period
+        self.rate = limit / period  # tokens per second
+        self.max_wait = max_wait
+        self.reserve = reserve * limit
+        self.tokens = float(limit)
+        self.queued = 0            # commands waiting for a token
+        self.shed = {COMMAND: 0, BACKGROUND: 0}
+        self._refilled_at = time.monotonic()
+        self._cond = threading.Condition()
+
+    # limiter for a backend from RATE_LIMITS and the <BACKEND>_RATE_LIMIT
+    # env var ("limit/period" or "off"); None when disabled
+    @classmethod
+    def for_backend(cls, name):
+        limit, period = RATE_LIMITS[name]
+        setting = os.environ.get(f"{name.upper()}_RATE_LIMIT")
+        if setting:
+            if setting.lower() == "off":
+                return None
+            limit, _, period = setting.partition("/")
+            limit, period = int(limit), float(period or 60)
+        return cls(name, limit, period)
+
+    def _refill(self):
+        now = time.monotonic()
+        if now > self._refilled_at:
+            self.tokens = min(self.limit, self.tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+
+    # take a token for one request, waiting for it if allowed; raises
+    # RateLimitedError when the request is shed
+    def acquire(self, priority=None):
+        priority = priority or current_priority()
+        start = time.monotonic()
+        with self._cond:
+            if priority == COMMAND:
+                self.queued += 1
+            try:
+                while True:
+                    self._refill()
+                    if priority == BACKGROUND:
+                        if not self.queued and self.tokens >= 1 + self.reserve:
+                            self.tokens -= 1
+                            return
+                        self._shed(priority)
+
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        REGISTRY.observe("rate_limit_wait_seconds",
+                                         time.monotonic() - start, backend=self.name)
+                        return
+                    # also covers a pause after a 429 (_refilled_at in the future)
+                    wait = (max(0.0, self._refilled_at - time.monotonic())
+                            + (1 - self.tokens) / self.rate)
+                    if time.monotonic() + wait - start > self.max_wait:
+                        self._shed(priority)
+                    self._cond.wait(wait)
+            finally:
+                if priority == COMMAND:
+                    self.queued -= 1
+                    self._cond.notify_all()
+
+    def _shed(self, priority):
+        self.shed[priority] += 1
+        REGISTRY.inc("rate_limit_shed_total", backend=self.name, priority=priority)
+        raise RateLimitedError(f"{self.name} request budget used up, "
+                               f"{priority} request not sent")
+
+    # correct the bucket from a response: never assume more budget than the
+    # server reports left, and stop refilling until a 429's Retry-After ends
+    def observe(self, response):
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        with self._cond:
+            self._refill()
+            if remaining is not None and remaining.isdigit():
+                self.tokens = min(self.tokens, float(remaining))
+            if response.status_code == 429:
+                self.tokens = 0.0
+                self._refilled_at = time.monotonic() + (retry_after(response) or 1.0)
+
+    # whole requests that can be sent right now
+    def remaining(self):
+        with self._cond:
+            self._refill()
+            return int(self.tokens)
+
+    def snapshot(self):
+        return {
+            "limit": self.limit,
+            "period": self.period,
+            "remaining": self.remaining(),
+            "queued": self.queued,
+            "shed": dict(self.shed)
+        }
+
+
+# requests adapter that takes a token from the limiter before every request
+class RateLimitedAdapter(HTTPAdapter):
+    def __init__(self, limiter, **kwargs):
+        self.limiter = limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        self.limiter.acquire()
+        response = super().send(request, **kwargs)
+        self.limiter.observe(response)
+        return response
@@ -0,0 +1,200 @@
+# resilience.py
+# Author: Andrew Aberer
+# Retries, Retry-After handling and a circuit breaker around the controllers'
+# API calls, so a slow or dead backend costs a bounded amount of time per
+# command instead of stalling the gesture path:
+#   - transient failures (connection errors, timeouts, 5xx) are retried with
+#     jittered exponential backoff, but only for idempotent calls; a call
+#     that may have taken effect (e.g. "next track") is only retried when the
+#     request provably never got through (connect timeout, 429)
+#   - a 429 Retry-After is waited out when it is short, and fails fast when
+#     it is longer than MAX_RETRY_AFTER (later calls fail fast until it ends)
+#   - all attempts of one call share a DEADLINE
+#   - after FAILURE_THRESHOLD failed attempts in a row the circuit opens:
+#     calls fail at once with CircuitOpenError while a background probe
+#     checks the backend every RECOVERY_TIMEOUT seconds and closes the
+#     circuit again once it answers
+
+import logging
+import os
+import random
+import sys
+import threading
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from metrics.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3          # tries per call, including the first
+BACKOFF_BASE = 0.2        # seconds; the n-th retry waits up to BACKOFF_BASE * 2**n
+BACKOFF_MAX = 2.0         # seconds, cap on a single backoff
+DEADLINE = 8.0            # seconds all attempts of one call may take
+MAX_RETRY_AFTER = 5.0     # seconds of Retry-After worth waiting for
+FAILURE_THRESHOLD = 3     # failed attempts in a row that open the circuit
+RECOVERY_TIMEOUT = 10.0   # seconds between background probes while open
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class RateLimitedError(Exception):
+    pass
+
+
+# HTTP status of a failed call (requests.HTTPError or SpotifyException), or None
+def status_of(exc):
+    status = getattr(exc, "http_status", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+# seconds the server asked us to wait (429 Retry-After header), or None
+def retry_after(exc):
+    headers = getattr(exc, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(exc, "response", None), "headers", None)
+    try:
+        return float((headers or {}).get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+# True if the failure says the backend is down or broken (rather than the
+# request being wrong, or us being rate limited)
+def is_outage(exc):
+    status = status_of(exc)
+    if status is not None:
+        return status >= 500
+    # requests' exceptions are OSErrors too, so this also covers the LAN
+    # transport's socket errors and timeouts
+    return isinstance(exc, OSError)
+
+
+class CircuitBreaker:
+    # probe: callable that raises if the backend is still down; run in the
+    # background while the circuit is open
+    def __init__(self, name, probe=None, failure_threshold=FAILURE_THRESHOLD,
+                 recovery_timeout=RECOVERY_TIMEOUT):
+        self.name = name
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            # without a probe, let one trial call through after the timeout
+            if self.probe is None and time.monotonic() - self.opened_at >= self.recovery_timeout:
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self.state == "open":
+                self._set_state("closed")
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "closed" and self.failures >= self.failure_threshold:
+                self._set_state("open")
+                self.opened_at = time.monotonic()
+                if self.probe is not None:
+                    threading.Thread(target=self._probe_until_closed,
+                                     name=f"{self.name}-probe", daemon=True).start()
+
+    def _set_state(self, state):
+        logger.warning(f"{self.name} circuit {state}")
+        self.state = state
+        REGISTRY.inc("circuit_breaker_transitions_total", controller=self.name, state=state)
+
+    def _probe_until_closed(self):
+        while not self._stopped.wait(self.recovery_timeout):
+            try:
+                self.probe()
+            except Exception as e:
+                logger.info(f"{self.name} still unavailable: {str(e)}")
+                continue
+            self.record_success()
+            return
+
+    # stop background probing (on shutdown)
+    def stop(self):
+        self._stopped.set()
+
+
+class Resilience:
+    # one per controller; name labels the logs and metrics
+    def __init__(self, name, probe=None, attempts=MAX_ATTEMPTS, deadline=DEADLINE):
+        self.name = name
+        self.attempts = attempts
+        self.deadline = deadline
+        self.breaker = CircuitBreaker(name, probe)
+        self.blocked_until = 0.0  # end of the latest Retry-After
+        self.random = random.Random()
+
+    # fn(*args, **kwargs) with retries. idempotent: safe to send twice.
+    # attempts: overrides the number of tries (e.g. 1 where the transport
+    # already resends on its own)
+    def call(self, fn, *args, idempotent=True, attempts=None, **kwargs):
+        start = time.monotonic()
+        attempts = attempts or self.attempts
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"{self.name} is unavailable, not sending the request")
+            self._wait_for_rate_limit(start)
+
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._on_failure(e, idempotent, attempt)
+                if delay is None or attempt + 1 >= attempts:
+                    raise
+                if time.monotonic() + delay - start > self.deadline:
+                    raise
+                REGISTRY.inc("controller_retries_total", controller=self.name)
+                logger.info(f"Retrying {self.name} request in {delay:.2f}s: {str(e)}")
+                time.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    # wait out a short Retry-After; fail fast if it runs past the deadline
+    def _wait_for_rate_limit(self, start):
+        wait = self.blocked_until - time.monotonic()
+        if wait <= 0:
+            return
+        if wait > MAX_RETRY_AFTER or time.monotonic() + wait - start > self.deadline:
+            raise RateLimitedError(f"{self.name} rate limited for another {wait:.0f}s")
+        time.sleep(wait)
+
+    # record a failed attempt; seconds to wait before retrying, or None if
+    # it must not be retried
+    def _on_failure(self, exc, idempotent, attempt):
+        if status_of(exc) == 429:
+            self.blocked_until = time.monotonic() + (retry_after(exc) or 1.0)
+            return 0.0  # the wait happens in _wait_for_rate_limit
+
+        if not is_outage(exc):
+            return None  # the request itself was wrong; retrying won't help
+        self.breaker.record_failure()
+        if not idempotent and not isinstance(exc, requests.ConnectTimeout):
+            return None  # it may have taken effect already
+        return self.random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    def close(self):
+        self.breaker.stop()
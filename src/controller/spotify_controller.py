@@ -2,46 +2,115 @@
 # Author: Andrew Aberer
 
 import spotipy
+import requests
 import sys
 import os
 import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from spotipy.oauth2 import SpotifyOAuth
+from spotipy.cache_handler import CacheFileHandler
 from constants.constants import SPOTIFY_COMMANDS
+from metrics.metrics import http_hook
+from controller.resilience import Resilience
+from controller.rate_limit import RateLimiter, RateLimitedAdapter, background_calls
 
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+PLAYBACK_TTL = 15.0        # seconds the cached playback state is used as is
+PLAYBACK_MAX_AGE = 120.0   # older than this, fetch the state before acting on it
+TRACK_CHANGE_DELAY = 0.5   # seconds Spotify needs before a skip shows up in the playback state
+CONNECT_TIMEOUT = 3.05     # seconds to open a connection
+READ_TIMEOUT = 5.0         # seconds to wait for a response
+TOKEN_REFRESH_MARGIN = 300.0  # seconds before expiry the OAuth token is refreshed
+TOKEN_RETRY_DELAY = 30.0      # seconds before retrying a failed token refresh, or
+                              # looking for a token again before the first login
+TOKEN_CACHE_PATH = ".spotifycache"
+# auth levels
+SCOPE = "user-read-playback-state user-modify-playback-state user-library-modify user-library-read"
+
 
 class SpotifyController:
     # init Spotify controller with API oauth
-    def __init__(self):
+    # api_url: Web API base URL instead of https://api.spotify.com/v1/
+    #          (or the SPOTIFY_API_URL env var, e.g. a local stand-in)
+    # access_token: fixed bearer token instead of OAuth (or SPOTIFY_ACCESS_TOKEN)
+    def __init__(self, api_url=None, access_token=None):
         try:
             # creds - set these env vars in your zshrc/basrc or similar
             client_id = os.environ.get('SPOTIFY_CLIENT_ID')
             client_secret = os.environ.get('SPOTIFY_CLIENT_SECRET')
             redirect_uri = os.environ.get('SPOTIFY_REDIRECT_URI')
+            api_url = api_url or os.environ.get('SPOTIFY_API_URL')
+            access_token = access_token or os.environ.get('SPOTIFY_ACCESS_TOKEN')
 
-            if not all([client_id, client_secret, redirect_uri]):
+            if not access_token and not all([client_id, client_secret, redirect_uri]):
                 logger.error(
                     "Missing Spotify API credentials. Please set environment variables.")
                 raise ValueError(
                     "Spotify API credentials not found in environment variables")
 
-            # auth levels
-            scope = "user-read-playback-state user-modify-playback-state user-library-modify user-library-read"
+            # session for Web API calls, recording request time / status metrics
+            # every Web API request takes a token from the client-side
+            # budget first, so bursts queue here instead of drawing 429s
+            session = requests.Session()
+            session.hooks["response"].append(http_hook("spotify"))
+            self.limiter = RateLimiter.for_backend("spotify")
+            if self.limiter is not None:
+                adapter = RateLimitedAdapter(self.limiter)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
 
             # init
-            self.sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
-                client_id=client_id,
-                client_secret=client_secret,
-                redirect_uri=redirect_uri,
-                scope=scope,
-                cache_path=".spotifycache"
-            ))
+            if access_token:
+                self.sp = spotipy.Spotify(auth=access_token, requests_session=session,
+                                          requests_timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            else:
+                self.sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
+                    client_id=client_id,
+                    client_secret=client_secret,
+                    redirect_uri=redirect_uri,
+                    scope=SCOPE,
+                    cache_path=TOKEN_CACHE_PATH
+                ), requests_session=session,
+                    requests_timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+
+                # the first login asks for the redirect URL on the terminal,
+                # so it happens here, on the main thread, before anything
+                # runs in the background (see ControllerManager.start)
+                auth = self.sp.auth_manager
+                if auth.validate_token(auth.cache_handler.get_cached_token()) is None:
+                    if threading.current_thread() is not threading.main_thread():
+                        raise RuntimeError("Spotify login required; "
+                                           "start the Spotify controller on the main thread")
+                    auth.get_access_token(as_dict=False)
+            if api_url:
+                self.sp.prefix = api_url if api_url.endswith("/") else api_url + "/"
+
+            # retries, Retry-After and a circuit breaker around every call
+            self.resilience = Resilience("spotify", probe=self._probe)
+
+            # cached current_playback() result, updated optimistically by
+            # commands; lookups that only feed the log run in the background
+            self.playback_ttl = PLAYBACK_TTL
+            self._playback = None
+            self._playback_at = None  # None: never fetched, or invalidated
+            self._state_lock = threading.Lock()
+            self._background = ThreadPoolExecutor(max_workers=1,
+                                                  thread_name_prefix="spotify-background")
+            self._refreshing = False
+            self._refresh_in_background()  # so the first gesture finds a warm cache
+
+            # keep the OAuth token fresh in the background, so no gesture
+            # waits on the token endpoint
+            self._token_timer = None
+            self._closed = False
+            self._schedule_token_refresh()
 
             logger.info("Spotify controller initialized successfully")
 
@@ -50,7 +119,7 @@ class SpotifyController:
             raise
 
     # execute a Spotify command based on the input string
-    def execute_command(self, command):
+    def execute_command(self, command, **kwargs):
         logger.info(f"Executing Spotify command: {command}")
 
         command_map = {
@@ -66,7 +135,7 @@ class SpotifyController:
 
         if command in command_map:
             try:
-                command_map[command]()
+                command_map[command](**kwargs)
                 return True
             except Exception as e:
                 logger.error(f"Error executing command '{command}': {str(e)}")
@@ -75,55 +144,179 @@ class SpotifyController:
             logger.warning(f"Unknown command: {command}")
             return False
 
+    # fetch the playback state from Spotify and cache it (None if nothing is playing)
+    def refresh_playback(self):
+        playback = self.resilience.call(self.sp.current_playback)
+        with self._state_lock:
+            self._playback = playback
+            self._playback_at = time.monotonic()
+        return playback
+
+    # cached playback state. Within playback_ttl it is used as is; older (up
+    # to PLAYBACK_MAX_AGE) it is still used while a refresh runs in the
+    # background; with no usable cache it is fetched now.
+    def playback_state(self):
+        with self._state_lock:
+            age = float("inf") if self._playback_at is None else time.monotonic() - self._playback_at
+            playback = self._playback if age <= PLAYBACK_MAX_AGE else None
+            stale = playback is not None and age > self.playback_ttl
+        if playback is None:
+            return self.refresh_playback()
+        if stale:
+            self._refresh_in_background()
+        return playback
+
+    def _refresh_in_background(self):
+        with self._state_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                with background_calls():
+                    self.refresh_playback()
+            except Exception as e:
+                logger.warning(f"Failed to refresh playback state: {str(e)}")
+            finally:
+                self._refreshing = False
+
+        self._background.submit(refresh)
+
+    # raises while the Web API is unreachable; the circuit breaker runs this
+    # in the background to find out when it is back
+    def _probe(self):
+        with background_calls():
+            self.sp.current_playback()
+
+    # True if OAuth is used and no token for SCOPE has been cached yet, i.e.
+    # starting the controller would prompt for a login
+    @staticmethod
+    def needs_login():
+        if os.environ.get('SPOTIFY_ACCESS_TOKEN'):
+            return False
+        token = CacheFileHandler(cache_path=TOKEN_CACHE_PATH).get_cached_token()
+        return not token or not set(SCOPE.split()) <= set(token.get("scope", "").split())
+
+    # refresh the OAuth token TOKEN_REFRESH_MARGIN seconds before it expires
+    # (straight away if it is already that close). Nothing to do with a
+    # fixed access token; with no refreshable token cached yet, look again
+    # every TOKEN_RETRY_DELAY seconds, so whatever token is acquired later
+    # gets refreshed too.
+    def _schedule_token_refresh(self, delay=None):
+        auth = self.sp.auth_manager
+        if auth is None or self._closed:
+            return
+        if delay is None:
+            token = auth.cache_handler.get_cached_token()
+            if token and "refresh_token" in token:
+                delay = max(1.0, token["expires_at"] - TOKEN_REFRESH_MARGIN - time.time())
+            else:
+                delay = TOKEN_RETRY_DELAY
+        self._token_timer = threading.Timer(delay, self._refresh_token)
+        self._token_timer.daemon = True
+        self._token_timer.start()
+
+    # refresh the cached token if it is due; never prompts for a login
+    def _refresh_token(self):
+        delay = None
+        try:
+            auth = self.sp.auth_manager
+            token = auth.cache_handler.get_cached_token()
+            if (token and "refresh_token" in token
+                    and token["expires_at"] - time.time() <= TOKEN_REFRESH_MARGIN + 1.0):
+                auth.refresh_access_token(token["refresh_token"])
+                logger.info("Refreshed Spotify access token")
+        except Exception as e:
+            logger.warning(f"Failed to refresh Spotify access token: {str(e)}")
+            delay = TOKEN_RETRY_DELAY
+        self._schedule_token_refresh(delay)
+
+    # forget the cached state (e.g. after a failed command)
+    def invalidate_cache(self):
+        with self._state_lock:
+            self._playback_at = None
+
+    # apply a successful command to the cached state
+    def _update_cache(self, **changes):
+        with self._state_lock:
+            if not self._playback:
+                return
+            for key, value in changes.items():
+                if key == "volume_percent":
+                    if self._playback.get("device"):
+                        self._playback["device"]["volume_percent"] = value
+                else:
+                    self._playback[key] = value
+
+    # after a skip the cached track is wrong; look the new one up (and log
+    # it) in the background once Spotify has caught up
+    def _after_track_change(self):
+        self._update_cache(item=None)
+
+        def lookup():
+            time.sleep(TRACK_CHANGE_DELAY)
+            try:
+                with background_calls():
+                    playback = self.refresh_playback()
+            except Exception as e:
+                logger.warning(f"Failed to get current track info: {str(e)}")
+                return
+            track = self._describe(playback)
+            if track:
+                logger.info(f"Now playing: {track}")
+
+        self._background.submit(lookup)
+
     # play/resume music
     def play_music(self):
         try:
-            self.sp.start_playback()
+            self.resilience.call(self.sp.start_playback)
+            self._update_cache(is_playing=True)
             logger.info("Music playback started")
         except Exception as e:
+            self.invalidate_cache()
             logger.error(f"Failed to start playback: {str(e)}")
             raise
 
     # pause music
     def pause_music(self):
         try:
-            self.sp.pause_playback()
+            self.resilience.call(self.sp.pause_playback)
+            self._update_cache(is_playing=False)
             logger.info("Music playback paused")
         except Exception as e:
+            self.invalidate_cache()
             logger.error(f"Failed to pause playback: {str(e)}")
             raise
 
     # skip to next song
     def next_track(self):
         try:
-            self.sp.next_track()
+            self.resilience.call(self.sp.next_track, idempotent=False)
             logger.info("Skipped to next track")
-            time.sleep(0.5)
-            current_track = self.get_current_track_info()
-            if current_track:
-                logger.info(f"Now playing: {current_track}")
+            self._after_track_change()
         except Exception as e:
+            self.invalidate_cache()
             logger.error(f"Failed to skip to next track: {str(e)}")
             raise
 
     # go back to last song
     def previous_track(self):
         try:
-            self.sp.previous_track()
+            self.resilience.call(self.sp.previous_track, idempotent=False)
             logger.info("Returned to previous track")
-            time.sleep(0.5)
-            current_track = self.get_current_track_info()
-            if current_track:
-                logger.info(f"Now playing: {current_track}")
+            self._after_track_change()
         except Exception as e:
+            self.invalidate_cache()
             logger.error(f"Failed to return to previous track: {str(e)}")
             raise
 
     # increase volume by increment percentage
     def volume_up(self, increment=10):
         try:
-            # Get current playback info
-            current_playback = self.sp.current_playback()
+            # Get current playback info (cached, so repeated swipes add up)
+            current_playback = self.playback_state()
             if not current_playback:
                 logger.warning("No active playback found")
                 return
@@ -131,17 +324,19 @@ class SpotifyController:
             current_volume = current_playback['device']['volume_percent']
             new_volume = min(current_volume + increment, 100)
 
-            self.sp.volume(new_volume)
+            self.resilience.call(self.sp.volume, new_volume)
+            self._update_cache(volume_percent=new_volume)
             logger.info(
                 f"Volume increased from {current_volume}% to {new_volume}%")
         except Exception as e:
+            self.invalidate_cache()
             logger.error(f"Failed to increase volume: {str(e)}")
             raise
 
     # decrease volume by decrement percentage
     def volume_down(self, decrement=10):
         try:
-            current_playback = self.sp.current_playback()
+            current_playback = self.playback_state()
             if not current_playback:
                 logger.warning("No active playback found")
                 return
@@ -149,17 +344,19 @@ class SpotifyController:
             current_volume = current_playback['device']['volume_percent']
             new_volume = max(current_volume - decrement, 0)
 
-            self.sp.volume(new_volume)
+            self.resilience.call(self.sp.volume, new_volume)
+            self._update_cache(volume_percent=new_volume)
             logger.info(
                 f"Volume decreased from {current_volume}% to {new_volume}%")
         except Exception as e:
+            self.invalidate_cache()
             logger.error(f"Failed to decrease volume: {str(e)}")
             raise
 
     # toggle shuffle
     def toggle_shuffle(self):
         try:
-            current_playback = self.sp.current_playback()
+            current_playback = self.playback_state()
             if not current_playback:
                 logger.warning("No active playback found")
                 return
@@ -167,17 +364,20 @@ class SpotifyController:
             current_shuffle = current_playback['shuffle_state']
             new_shuffle = not current_shuffle
 
-            self.sp.shuffle(new_shuffle)
+            self.resilience.call(self.sp.shuffle, new_shuffle)
+            self._update_cache(shuffle_state=new_shuffle)
             logger.info(f"Shuffle {'enabled' if new_shuffle else 'disabled'}")
         except Exception as e:
+            self.invalidate_cache()
             logger.error(f"Failed to toggle shuffle: {str(e)}")
             raise
 
     # add to liked songs
     def add_to_favorites(self):
         try:
-            current_track = self.sp.current_user_playing_track()
-            if not current_track:
+            # always the track playing now: a cached one may have ended since
+            current_track = self.refresh_playback()
+            if not current_track or not current_track.get('item'):
                 logger.warning("No track currently playing")
                 return
 
@@ -185,25 +385,33 @@ class SpotifyController:
             track_name = current_track['item']['name']
             artist_name = current_track['item']['artists'][0]['name']
 
-            self.sp.current_user_saved_tracks_add([track_id])
+            self.resilience.call(self.sp.current_user_saved_tracks_add, [track_id])
             logger.info(
                 f"Added '{track_name}' by {artist_name} to your Liked Songs")
         except Exception as e:
             logger.error(f"Failed to add track to favorites: {str(e)}")
             raise
 
+    # stop the background lookups and token refreshes
+    def close(self):
+        self._closed = True
+        self.resilience.close()
+        if self._token_timer is not None:
+            self._token_timer.cancel()
+        self._background.shutdown(wait=False, cancel_futures=True)
+
+    # "<track> by <artist>" for a playback / currently-playing result
+    @staticmethod
+    def _describe(current_track):
+        if not current_track or not current_track.get('item'):
+            return None
+        track = current_track['item']
+        return f"{track['name']} by {track['artists'][0]['name']}"
+
     # current song stats
     def get_current_track_info(self):
         try:
-            current_track = self.sp.current_user_playing_track()
-            if not current_track or not current_track['item']:
-                return None
-
-            track = current_track['item']
-            artist = track['artists'][0]['name']
-            track_name = track['name']
-
-            return f"{track_name} by {artist}"
+            return self._describe(self.resilience.call(self.sp.current_user_playing_track))
         except Exception as e:
             logger.error(f"Failed to get current track info: {str(e)}")
             return None
@@ -0,0 +1,75 @@
+# augment.py
+# Author: Caden Calderon
+# Batched, on-the-fly augmentations for (B, T, 63) landmark sequences,
+# run inside the tf.data pipeline. The sequences are already preprocessed
+# (wrist-centered, unit hand size), so there is no scale augmentation:
+# inference normalizes the scale away, and training on other sizes would
+# only teach the model hands it never sees.
+
+import math
+import numpy as np
+import tensorflow as tf
+import processing
+
+
+class AugmentConfig:
+    ROTATION_MAX = math.radians(15)  # In-plane rotation range (+/- radians)
+    NOISE_STD = 0.02                 # Gaussian noise per landmark coordinate
+    TIME_WARP = 0.2                  # Playback speed drawn from 1 +/- this
+
+
+def _as_points(batch):
+    # (B, T, 63) -> (B, T, 21, 3)
+    shape = tf.shape(batch)
+    return tf.reshape(batch, [shape[0], shape[1], 21, 3])
+
+
+def _as_frames(pts):
+    shape = tf.shape(pts)
+    return tf.reshape(pts, [shape[0], shape[1], 63])
+
+
+# Rotate every sequence by a random in-plane angle about the wrist, with
+# the same rotation the preprocessing uses (processing.rotate_in_plane)
+def random_rotation(batch, max_angle=AugmentConfig.ROTATION_MAX):
+    angle = tf.random.uniform([tf.shape(batch)[0], 1], -max_angle, max_angle)
+
+    def rotate(pts, angle):
+        pts = pts.copy()
+        processing.rotate_in_plane(pts, np.broadcast_to(angle, pts.shape[:2]))
+        return pts
+
+    pts = tf.numpy_function(rotate, [_as_points(batch), angle], tf.float32)
+    return tf.ensure_shape(_as_frames(pts), batch.shape)
+
+
+# Add Gaussian noise to every landmark coordinate
+def random_noise(batch, std=AugmentConfig.NOISE_STD):
+    return batch + tf.random.normal(tf.shape(batch), stddev=std)
+
+
+# Resample each sequence at a random playback speed (linear interpolation),
+# keeping the sequence length fixed
+def random_time_warp(batch, warp=AugmentConfig.TIME_WARP):
+    batch_size = tf.shape(batch)[0]
+    length = tf.shape(batch)[1]
+    last = tf.cast(length - 1, tf.float32)
+
+    # sample positions stretched/squeezed around the middle of the window
+    speed = tf.random.uniform([batch_size, 1], 1 - warp, 1 + warp)
+    steps = tf.range(length, dtype=tf.float32)[None, :]
+    positions = tf.clip_by_value(last / 2 + (steps - last / 2) * speed, 0.0, last)
+
+    lo = tf.cast(tf.floor(positions), tf.int32)
+    hi = tf.minimum(lo + 1, length - 1)
+    frac = (positions - tf.cast(lo, tf.float32))[..., None]
+    lo_frames = tf.gather(batch, lo, batch_dims=1)
+    hi_frames = tf.gather(batch, hi, batch_dims=1)
+    return lo_frames + (hi_frames - lo_frames) * frac
+
+
+def augment_batch(batch, labels):
+    batch = random_time_warp(batch)
+    batch = random_rotation(batch)
+    batch = random_noise(batch)
+    return batch, labels
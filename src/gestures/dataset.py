@@ -0,0 +1,193 @@
+# dataset.py
+# Author: Caden Calderon
+# Packs collected_data/{gesture}_{partition}/sequence_*.npy into one
+# contiguous array per partition so training can memory-map it.
+# Re-packing is incremental: rows are cached by a path + mtime + size
+# fingerprint, so only added or changed sequences are read again.
+#
+# Usage (from the project root):
+#   python src/gestures/dataset.py               # float32 pack
+#   python src/gestures/dataset.py --dtype float16
+
+import os
+import re
+import json
+import hashlib
+import argparse
+import numpy as np
+from glob import glob
+from concurrent.futures import ThreadPoolExecutor
+
+gesture_list = ["closed_to_open", "open_to_closed", "swipe_left", "swipe_right", "swipe_up", "swipe_down", "one", "two", "three", "four"]
+gesture_partition = ["train", "test", "validate"]
+
+DATA_DIR = "collected_data"
+PACK_DIR = os.path.join(DATA_DIR, "packed")
+MANIFEST_NAME = "manifest.json"
+SEQUENCE_LENGTH = 20
+NUM_FEATURES = 63
+LOAD_WORKERS = 8
+
+
+def _sequence_number(path):
+    match = re.search(r"sequence_(\d+)\.npy$", path)
+    return int(match.group(1)) if match else -1
+
+
+# list (path, label) pairs for a partition, in a stable order
+def list_sources(partition, data_dir=DATA_DIR):
+    sources = []
+    for label, gesture in enumerate(gesture_list):
+        paths = glob(os.path.join(data_dir, f"{gesture}_{partition}", "*.npy"))
+        for path in sorted(paths, key=_sequence_number):
+            sources.append((path, label))
+    return sources
+
+
+# cache key for a sequence file: changes whenever the file is replaced
+def fingerprint(path, data_dir=DATA_DIR):
+    st = os.stat(path)
+    key = f"{os.path.relpath(path, data_dir)}:{st.st_mtime_ns}:{st.st_size}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _read_sequence(path):
+    sequence = np.load(path)
+    if sequence.shape != (SEQUENCE_LENGTH, NUM_FEATURES):
+        return None, list(sequence.shape)
+    return sequence, list(sequence.shape)
+
+
+# write <pack_dir>/<partition>_X.npy, <partition>_y.npy and a manifest
+# that records the label, source path and fingerprint of every row.
+# Rows whose fingerprint matches the previous pack are copied from it;
+# everything else is read on a thread pool. Sequences with the wrong
+# shape are reported and left out instead of aborting the pack.
+def pack_dataset(data_dir=DATA_DIR, pack_dir=PACK_DIR, dtype=None,
+                 workers=LOAD_WORKERS):
+    os.makedirs(pack_dir, exist_ok=True)
+    previous = load_manifest(pack_dir) if has_pack(pack_dir) else None
+
+    # keep the existing pack's dtype unless asked to change it
+    if dtype is None:
+        dtype = previous["dtype"] if previous else np.float32
+    dtype = np.dtype(dtype)
+    if previous and previous.get("dtype") != dtype.name:
+        previous = None  # dtype changed, nothing can be reused
+
+    manifest = {
+        "gesture_list": gesture_list,
+        "dtype": dtype.name,
+        "sequence_length": SEQUENCE_LENGTH,
+        "partitions": {}
+    }
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for partition in gesture_partition:
+            old = previous["partitions"].get(partition) if previous else None
+            manifest["partitions"][partition] = _pack_partition(
+                partition, data_dir, pack_dir, dtype, old, pool)
+
+    with open(os.path.join(pack_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+def _pack_partition(partition, data_dir, pack_dir, dtype, old, pool):
+    x_name, y_name = f"{partition}_X.npy", f"{partition}_y.npy"
+    x_path = os.path.join(pack_dir, x_name)
+
+    sources = list_sources(partition, data_dir)
+    keys = [fingerprint(path, data_dir) for path, _ in sources]
+
+    # what the previous pack already knows about
+    reusable = bool(old) and os.path.exists(x_path)
+    old_rows, old_invalid = {}, {}
+    if reusable:
+        old_rows = {key: row for row, key in enumerate(old["keys"])}
+        old_invalid = {entry["key"]: entry for entry in old.get("invalid", [])}
+
+    # 1) read only the new or changed files, in parallel
+    stale = [i for i, key in enumerate(keys)
+             if key not in old_rows and key not in old_invalid]
+    fresh = dict(zip(stale, pool.map(_read_sequence,
+                                     [sources[i][0] for i in stale])))
+
+    # 2) decide which rows end up in the pack
+    kept, invalid = [], []
+    for i, ((path, label), key) in enumerate(zip(sources, keys)):
+        rel = os.path.relpath(path, data_dir)
+        if key in old_invalid or (i in fresh and fresh[i][0] is None):
+            shape = old_invalid[key]["shape"] if key in old_invalid else fresh[i][1]
+            print(f"Error: sequence shape {tuple(shape)} in {path}, skipping")
+            invalid.append({"source": rel, "key": key, "shape": shape})
+            continue
+        kept.append((i, rel, label, key))
+
+    kept_keys = [key for _, _, _, key in kept]
+    if reusable and not fresh and kept_keys == old["keys"]:
+        print(f"{partition}: {len(kept)} sequences, up to date")
+    else:
+        # 3) write the new pack next to the old one, then swap it in
+        old_X = np.load(x_path, mmap_mode="r") if old_rows else None
+        tmp_path = x_path + ".tmp.npy"
+        X = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=dtype,
+            shape=(len(kept), SEQUENCE_LENGTH, NUM_FEATURES))
+        for row, (i, _, _, key) in enumerate(kept):
+            X[row] = fresh[i][0] if i in fresh else old_X[old_rows[key]]
+        X.flush()
+        del X, old_X
+        os.replace(tmp_path, x_path)
+        reused = sum(1 for i, _, _, _ in kept if i not in fresh)
+        print(f"{partition}: {len(kept)} sequences "
+              f"({len(stale)} read, {reused} reused, {len(invalid)} invalid)")
+
+    y = np.array([label for _, _, label, _ in kept], dtype=np.int32)
+    np.save(os.path.join(pack_dir, y_name), y)
+
+    return {
+        "X": x_name,
+        "y": y_name,
+        "count": len(kept),
+        "sources": [rel for _, rel, _, _ in kept],
+        "labels": y.tolist(),
+        "keys": kept_keys,
+        "invalid": invalid
+    }
+
+
+def has_pack(pack_dir=PACK_DIR):
+    return os.path.exists(os.path.join(pack_dir, MANIFEST_NAME))
+
+
+def load_manifest(pack_dir=PACK_DIR):
+    with open(os.path.join(pack_dir, MANIFEST_NAME)) as f:
+        return json.load(f)
+
+
+# open one partition of the pack; X is a read-only memory map
+def load_packed(partition, pack_dir=PACK_DIR, manifest=None):
+    manifest = manifest or load_manifest(pack_dir)
+    entry = manifest["partitions"][partition]
+    X = np.load(os.path.join(pack_dir, entry["X"]), mmap_mode="r")
+    y = np.load(os.path.join(pack_dir, entry["y"]))
+    return X, y
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack collected gesture sequences")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--pack-dir", default=PACK_DIR)
+    parser.add_argument("--dtype", default=None,
+                        choices=["float32", "float16"],
+                        help="defaults to the existing pack's dtype, else float32")
+    parser.add_argument("--workers", type=int, default=LOAD_WORKERS)
+    args = parser.parse_args()
+
+    pack_dataset(args.data_dir, args.pack_dir, args.dtype, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# export_tflite.py
+# Author: Caden Calderon
+# Exports the trained LSTM to float16, dynamic-range int8 (weights only) and
+# full int8 (weights and activations, calibrated on the train partition)
+# TFLite models and prints an accuracy-parity report against the Keras model
+# on the test partition.
+#
+# Usage (from the project root, after dataset.py has packed the data):
+#   python src/gestures/export_tflite.py
+#   python src/gestures/export_tflite.py --calibration-samples 500
+
+import os
+import time
+import tempfile
+import argparse
+import numpy as np
+import tensorflow as tf
+import dataset
+from inference import TFLiteBackend
+from tensorflow.keras.models import load_model
+from tensorflow.keras.layers import LSTM, Normalization
+
+MODEL_PATH = "best_gesture_lstm.h5"
+FLOAT16_PATH = "gesture_lstm_float16.tflite"
+DYNAMIC_INT8_PATH = "gesture_lstm_dynamic_int8.tflite"
+INT8_PATH = "gesture_lstm_int8.tflite"
+CALIBRATION_SAMPLES = 300
+
+
+# Go through a SavedModel with a fixed batch of one window (the shape the
+# live recognizer feeds) so the LSTMs become fused TFLite ops instead of
+# TensorList loops over resource variables
+def _convert(model, configure, path):
+    with tempfile.TemporaryDirectory(prefix="gesture_lstm_") as export_dir:
+        model.export(export_dir,
+                     input_signature=[tf.TensorSpec([1, 20, 63], tf.float32)])
+        converter = tf.lite.TFLiteConverter.from_saved_model(export_dir)
+        configure(converter)
+        tflite_model = converter.convert()
+    with open(path, "wb") as f:
+        f.write(tflite_model)
+    print(f"Saved → {path}")
+
+
+def export_float16(model, path=FLOAT16_PATH):
+    def configure(converter):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    _convert(model, configure, path)
+
+
+# int8 weights only (dynamic range); activations stay float
+def export_dynamic_int8(model, path=DYNAMIC_INT8_PATH):
+    def configure(converter):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    _convert(model, configure, path)
+
+
+# The same network in a form full-int8 calibration can handle: the fused
+# LSTM ops crash the calibrator (segfault), so the LSTMs are unrolled, and
+# the Normalization layer is folded into the first LSTM's input weights.
+# Left in, its output would need one int8 scale for every feature, and the
+# wrist coordinates (always 0 after preprocessing, variance 0) blow that
+# range up; their normalized value is always 0, so their weights are dropped.
+def _calibration_model(model):
+    layers, norm = [], None
+    for layer in model.layers:
+        if isinstance(layer, Normalization):
+            norm = layer
+            continue
+        if isinstance(layer, LSTM):
+            kernel, recurrent_kernel, bias = layer.get_weights()
+            if norm is not None:
+                mean = np.asarray(norm.mean, dtype=np.float32).reshape(-1)
+                std = np.sqrt(np.asarray(norm.variance, dtype=np.float32).reshape(-1))
+                constant = std < 1e-7  # Keras' epsilon for the divide
+                kernel = np.where(constant[:, None], 0.0,
+                                  kernel / np.maximum(std, 1e-7)[:, None])
+                bias = bias - mean @ kernel
+                norm = None
+            layer = LSTM.from_config(dict(layer.get_config(), unroll=True))
+            layer.build((None, None, kernel.shape[0]))
+            layer.set_weights([kernel, recurrent_kernel, bias])
+        layers.append(layer)
+    return tf.keras.Sequential([tf.keras.Input(model.input_shape[1:])] + layers)
+
+
+# int8 weights and activations, calibrated on X_calibration. Input/output
+# stay float32 so the recognizer feeds it the same windows.
+def export_int8(model, X_calibration, path=INT8_PATH):
+    def representative_dataset():
+        for sequence in X_calibration:
+            yield [np.asarray(sequence, dtype=np.float32)[None]]
+
+    def configure(converter):
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+    _convert(_calibration_model(model), configure, path)
+
+
+def _evaluate(predict_proba, X, y):
+    probs, times = [], []
+    for sequence in X:
+        x = np.asarray(sequence, dtype=np.float32)[None]
+        start = time.perf_counter()
+        probs.append(predict_proba(x))
+        times.append(time.perf_counter() - start)
+    probs = np.array(probs)
+    accuracy = float(np.mean(np.argmax(probs, axis=1) == y))
+    return probs, accuracy, 1000 * float(np.median(times))
+
+
+def parity_report(model, model_path, X_test, y_test, tflite_paths):
+    keras_probs, keras_acc, keras_ms = _evaluate(
+        lambda x: model(x, training=False).numpy()[0], X_test, y_test)
+    keras_cls = np.argmax(keras_probs, axis=1)
+
+    print(f"\nParity on {len(X_test)} test sequences")
+    print("-" * 72)
+    print(f"{'model':<32}{'size KB':>9}{'acc':>9}{'agree':>9}{'max |dp|':>10}{'ms':>7}")
+    print(f"{model_path:<32}{os.path.getsize(model_path) / 1024:>9.0f}"
+          f"{keras_acc:>9.3%}{'-':>9}{'-':>10}{keras_ms:>7.2f}")
+    for path in tflite_paths:
+        backend = TFLiteBackend(path)
+        probs, acc, ms = _evaluate(backend.predict_proba, X_test, y_test)
+        agree = float(np.mean(np.argmax(probs, axis=1) == keras_cls))
+        max_diff = float(np.max(np.abs(probs - keras_probs)))
+        print(f"{path:<32}{os.path.getsize(path) / 1024:>9.0f}"
+              f"{acc:>9.3%}{agree:>9.3%}{max_diff:>10.4f}{ms:>7.2f}")
+    print("-" * 72)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the gesture LSTM to TFLite")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--calibration-samples", type=int,
+                        default=CALIBRATION_SAMPLES)
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    X_train, _ = dataset.load_packed("train")
+    X_test, y_test = dataset.load_packed("test")
+
+    # spread the calibration windows over every gesture class
+    rng = np.random.default_rng(0)
+    count = min(args.calibration_samples, len(X_train))
+    X_calibration = X_train[np.sort(rng.choice(len(X_train), count, replace=False))]
+
+    export_float16(model)
+    export_dynamic_int8(model)
+    export_int8(model, X_calibration)
+    parity_report(model, args.model, X_test, y_test,
+                  [FLOAT16_PATH, DYNAMIC_INT8_PATH, INT8_PATH])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# gating.py
+# Author: Caden Calderon
+# Cuts work the recognizer does not need to do: skip LSTM calls while the
+# hand is not moving, and slow MediaPipe down while nobody is in view.
+
+import logging
+import time
+import numpy as np
+from . import processing
+
+logger = logging.getLogger(__name__)
+
+
+# Skips classification of windows with less landmark motion than
+# `threshold` (mean |frame-to-frame delta| over the window).
+# Held poses ("one" ... "four") are still, so the first still window after
+# movement is classified once; later still windows are skipped until the
+# hand moves again, since they would only repeat the same answer.
+class MotionGate:
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.still_classified = False
+        self.skipped = 0
+
+    # a new window starts (e.g. the hand left view): classify its first still one again
+    def reset(self):
+        self.still_classified = False
+
+    def motion(self, window):
+        return float(np.abs(processing.extract_motion_deltas(window)).mean())
+
+    def should_classify(self, window):
+        if self.threshold <= 0:
+            return True
+        if self.motion(window) >= self.threshold:
+            self.still_classified = False
+            return True
+        if self.still_classified:
+            self.skipped += 1
+            return False
+        self.still_classified = True
+        return True
+
+
+# Drops the camera to `idle_fps` (and MediaPipe to every `every`-th of
+# those frames) after `idle_after` seconds without a hand; the first frame
+# that finds a hand switches straight back to full rate. A returning hand
+# is seen within every / idle_fps seconds: 0.1 s with the defaults, while
+# every=5 would save more but take up to 0.5 s to wake.
+class IdleScheduler:
+    def __init__(self, idle_after=5.0, every=1, idle_fps=10, active_fps=30):
+        self.idle_after = idle_after
+        self.every = every
+        self.idle_fps = idle_fps
+        self.active_fps = active_fps
+        self.idle = False
+        self.last_hand_at = time.time()
+        self.applied_fps = active_fps
+        self._frame = 0
+
+    # whether this frame should go through MediaPipe
+    def should_process(self):
+        self._frame += 1
+        return not self.idle or self._frame % self.every == 0
+
+    def update(self, hand_present):
+        now = time.time()
+        if hand_present:
+            self.last_hand_at = now
+            if self.idle:
+                self.idle = False
+                logger.info("Hand detected, leaving idle mode")
+        elif not self.idle and now - self.last_hand_at >= self.idle_after:
+            self.idle = True
+            logger.info(f"No hand for {self.idle_after:.0f}s, entering idle mode")
+
+    # camera FPS to apply, or None if it is already set
+    def fps_change(self):
+        fps = self.idle_fps if self.idle else self.active_fps
+        if fps == self.applied_fps:
+            return None
+        self.applied_fps = fps
+        return fps
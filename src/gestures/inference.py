@@ -0,0 +1,113 @@
+# inference.py
+# Author: Caden Calderon
+# Inference backends for the live recognizer. Each backend takes a
+# (1, 20, 63) float32 window and returns the (10,) class probabilities.
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import load_model
+from tensorflow.keras.layers import LSTM, Dropout
+
+
+class KerasBackend:
+    def __init__(self, model_path, sequence_length=20):
+        self.model = load_model(model_path)
+        self.input_shape = (1, sequence_length, 63)
+
+        # Traced once for a fixed (1, T, 63) window, so each call skips the
+        # data adapter / callback setup that model.predict does every time
+        @tf.function(input_signature=[tf.TensorSpec(self.input_shape, tf.float32)])
+        def infer(x):
+            return self.model(x, training=False)
+
+        self._infer = infer
+
+    # run one dummy window so tracing happens before the first real gesture
+    def warmup(self):
+        self.predict_proba(np.zeros(self.input_shape, dtype=np.float32))
+
+    def predict_proba(self, x):
+        return self._infer(x)[0].numpy()
+
+
+class TFLiteBackend:
+    def __init__(self, model_path, num_threads=None):
+        self.interpreter = tf.lite.Interpreter(
+            model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+
+    def warmup(self):
+        self.predict_proba(np.zeros(self.input["shape"], dtype=np.float32))
+
+    def predict_proba(self, x):
+        # quantize the input if the model was exported with integer I/O
+        if self.input["dtype"] != np.float32:
+            scale, zero_point = self.input["quantization"]
+            x = np.round(x / scale + zero_point).astype(self.input["dtype"])
+        self.interpreter.set_tensor(self.input["index"], x)
+        self.interpreter.invoke()
+        probs = self.interpreter.get_tensor(self.output["index"])[0]
+        if self.output["dtype"] != np.float32:
+            scale, zero_point = self.output["quantization"]
+            probs = (probs.astype(np.float32) - zero_point) * scale
+        return probs
+
+
+# Per-frame streaming inference. Rebuilds the trained model with stateful
+# LSTMs over a (1, 1, 63) input and copies the weights across, so each
+# step() advances the 128- and 64-unit states by one frame at O(1) cost.
+# After T steps from reset() the output equals the windowed model's output
+# on those T frames.
+class StreamingBackend:
+    def __init__(self, model_path):
+        trained = load_model(model_path)
+
+        x = inputs = tf.keras.Input(batch_shape=(1, 1, 63))
+        self.lstms = []
+        for layer in trained.layers:
+            if isinstance(layer, Dropout):
+                continue  # inference only
+            config = layer.get_config()
+            for key in ("batch_input_shape", "batch_shape", "input_shape"):
+                config.pop(key, None)
+            if isinstance(layer, LSTM):
+                config["stateful"] = True
+            clone = layer.__class__.from_config(config)
+            x = clone(x)
+            clone.set_weights(layer.get_weights())
+            if hasattr(clone, "finalize_state"):
+                clone.finalize_state()  # Normalization: mean/var from weights
+            if isinstance(clone, LSTM):
+                self.lstms.append(clone)
+        self.model = tf.keras.Model(inputs, x)
+
+        @tf.function(input_signature=[tf.TensorSpec((1, 1, 63), tf.float32)])
+        def step(frame):
+            return self.model(frame, training=False)
+
+        self._step = step
+
+    def warmup(self):
+        self.step(np.zeros(63, dtype=np.float32))
+        self.reset()
+
+    # forget the gesture so far (back to the zero state training windows start from)
+    def reset(self):
+        for lstm in self.lstms:
+            lstm.reset_states()
+
+    # consume one preprocessed (63,) frame, return the (10,) probabilities
+    def step(self, frame):
+        x = np.asarray(frame, dtype=np.float32).reshape(1, 1, 63)
+        return self._step(x)[0].numpy()
+
+
+# pick the backend named by cfg.INFERENCE_BACKEND ("keras" or "tflite")
+def load_backend(cfg):
+    if cfg.INFERENCE_BACKEND == "tflite":
+        return TFLiteBackend(cfg.TFLITE_MODEL_PATH, cfg.TFLITE_THREADS)
+    if cfg.INFERENCE_BACKEND == "keras":
+        return KerasBackend(cfg.MODEL_PATH, cfg.SEQUENCE_LENGTH)
+    raise ValueError(f"Unknown inference backend: {cfg.INFERENCE_BACKEND}")
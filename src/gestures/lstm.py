@@ -2,7 +2,8 @@
 
 import tensorflow as tf
 import numpy as np
-from glob import glob
+import dataset
+import augment
 from tensorflow.keras import Sequential
 from tensorflow.keras.models import load_model
 from tensorflow.keras.layers import Normalization, LSTM, Dropout, Dense
@@ -13,36 +14,48 @@ gesture_partition = ["train", "test", "validate"]
 
 label_map = {name: idx for idx, name in enumerate(gesture_list)}
 
-X = {p: [] for p in gesture_partition}
-y = {p: [] for p in gesture_partition}
+BATCH_SIZE = 32
 
 
 def load_data():
-    for gesture in gesture_list:
-        for partition in gesture_partition:
-            for path in glob(f"collected_data/{gesture}_{partition}/*.npy"):
-                sequence = np.load(path)
-                if len(sequence) != 20:
-                    print(f"Error: sequence length mismatch in {path}")
-                X[partition].append(sequence)
-                y[partition].append(label_map[gesture])
+    # (Re)build the packed dataset; only new or changed sequences are read
+    dataset.pack_dataset()
 
-    # Convert lists to arrays (if non-empty)
+    manifest = dataset.load_manifest()
+    data = []
     for partition in gesture_partition:
-        if X[partition]:
-            X[partition] = np.stack(X[partition]).astype(np.float32)
-            y[partition] = np.array(y[partition], dtype=np.int32)
-        else:
+        X_part, y_part = dataset.load_packed(partition, manifest=manifest)
+        if len(X_part) == 0:
             print(f"Warning: No data for {partition}")
-            X[partition] = np.empty((0,))  # Adjust shape if needed
-            y[partition] = np.empty((0,))
+        data.extend([X_part, y_part])
 
-    # Unpack to individual variables
-    X_train, y_train = X["train"], y["train"]
-    X_test, y_test = X["test"], y["test"]
-    X_validate, y_validate = X["validate"], y["validate"]
-    
-    return X_train, y_train, X_test, y_test, X_validate, y_validate
+    # X_train, y_train, X_test, y_test, X_validate, y_validate
+    return tuple(data)
+
+
+# Stream batches out of the (memory-mapped) arrays with tf.data.
+# Training batches are reshuffled every epoch and augmented on the fly;
+# prefetch keeps the next batches ready while the model trains.
+def make_dataset(X, y, batch_size=BATCH_SIZE, training=False):
+    def take(idx):
+        idx = np.sort(idx)  # sorted reads are friendlier to the memory map
+        return X[idx].astype(np.float32), y[idx].astype(np.int32)
+
+    ds = tf.data.Dataset.range(len(X))
+    if training:
+        ds = ds.shuffle(len(X), reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+    ds = ds.map(
+        lambda idx: tf.numpy_function(take, [idx], (tf.float32, tf.int32)),
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=not training
+    )
+    ds = ds.map(lambda xb, yb: (tf.ensure_shape(xb, [None, 20, 63]),
+                                tf.ensure_shape(yb, [None])))
+    if training:
+        ds = ds.map(augment.augment_batch, num_parallel_calls=tf.data.AUTOTUNE,
+                    deterministic=False)
+    return ds.prefetch(tf.data.AUTOTUNE)
 
 
 def train_lstm(X_train, y_train, X_test, y_test, X_validate, y_validate):
@@ -84,21 +97,21 @@ def train_lstm(X_train, y_train, X_test, y_test, X_validate, y_validate):
         patience=3
     )
     
-    # Shuffle the training data
-    idx = np.random.permutation(len(X_train))
-    X_train, y_train = X_train[idx], y_train[idx]
+    # Input pipelines (shuffling + augmentation happen per epoch)
+    train_ds = make_dataset(X_train, y_train, training=True)
+    validate_ds = make_dataset(X_validate, y_validate)
+    test_ds = make_dataset(X_test, y_test)
 
     # Train 
     history = model.fit(
-        X_train, y_train,
-        validation_data=(X_validate, y_validate),
+        train_ds,
+        validation_data=validate_ds,
         epochs=50,
-        batch_size=32,
         callbacks=[early_stop, checkpoint, reduce_lr]
     )
     
     # Evaluate on test set
-    test_loss, test_acc = model.evaluate(X_test, y_test)
+    test_loss, test_acc = model.evaluate(test_ds)
     print(f"Test accuracy: {test_acc:.3%}")
     
     
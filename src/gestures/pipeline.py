@@ -0,0 +1,140 @@
+# pipeline.py
+# Author: Caden Calderon
+# Building blocks for the threaded capture → landmark → classify pipeline.
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# One frame travelling through the pipeline
+class Packet:
+    __slots__ = ("frame", "results", "proc", "stamps", "timestamp", "timings")
+
+    def __init__(self, frame, timestamp=None):
+        self.frame = frame      # BGR camera frame (annotated by the landmark stage)
+        self.results = None     # MediaPipe hands result
+        self.proc = None        # preprocessed (63,) landmarks, if any
+        self.stamps = {"capture": time.perf_counter()}
+        # source clock in seconds (wall time for the camera, video time for replays)
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.timings = {}       # seconds spent per step, for benchmarks
+
+
+# Hand-off between two stages that only keeps the newest item. A put()
+# over an item nobody has taken yet replaces it and counts as a drop, so a
+# slow consumer always works on the freshest frame instead of a backlog.
+class LatestSlot:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._full = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._full:
+                self.dropped += 1
+            self._item = item
+            self._full = True
+            self._cond.notify()
+
+    # newest item, or None if nothing arrived within timeout
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._full:
+                self._cond.wait(timeout)
+            if not self._full:
+                return None
+            item, self._item, self._full = self._item, None, False
+            return item
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._processed = 0
+        self._busy = 0.0
+
+    def record(self, seconds):
+        with self._lock:
+            self._processed += 1
+            self._busy += seconds
+
+    # (items processed, seconds spent working) since the last call
+    def take(self):
+        with self._lock:
+            taken = self._processed, self._busy
+            self._processed, self._busy = 0, 0.0
+            return taken
+
+
+# Worker thread running `work` on every item from `inbox` and handing the
+# result to each of `outboxes`. Stages without an inbox are sources and
+# call `work(None)` in a loop. Returning None passes nothing on.
+class Stage(threading.Thread):
+    def __init__(self, name, work, stop_event, inbox=None, outboxes=()):
+        super().__init__(name=name, daemon=True)
+        self.work = work
+        self.stop_event = stop_event
+        self.inbox = inbox
+        self.outboxes = outboxes
+        self.stats = StageStats(name)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            item = None
+            if self.inbox is not None:
+                item = self.inbox.get(timeout=0.1)
+                if item is None:
+                    continue
+
+            start = time.perf_counter()
+            try:
+                out = self.work(item)
+            except Exception:
+                logger.exception(f"Pipeline stage '{self.name}' failed")
+                self.stop_event.set()
+                break
+            self.stats.record(time.perf_counter() - start)
+
+            if out is not None:
+                for outbox in self.outboxes:
+                    outbox.put(out)
+
+
+# Periodically logs per-stage throughput, utilisation and drops, and names
+# the busiest stage as the bottleneck
+class PipelineMonitor:
+    def __init__(self, stages, interval=5.0):
+        self.stages = stages
+        self.interval = interval
+        self._last = time.perf_counter()
+        self._dropped = {stage.name: 0 for stage in stages}
+
+    def poll(self):
+        now = time.perf_counter()
+        elapsed = now - self._last
+        if not self.interval or elapsed < self.interval:
+            return None
+        self._last = now
+
+        parts, busiest = [], None
+        for stage in self.stages:
+            processed, busy = stage.stats.take()
+            dropped = stage.inbox.dropped if stage.inbox is not None else 0
+            new_drops = dropped - self._dropped[stage.name]
+            self._dropped[stage.name] = dropped
+
+            utilisation = busy / elapsed
+            if busiest is None or utilisation > busiest[1]:
+                busiest = (stage.name, utilisation)
+            parts.append(f"{stage.name} {processed / elapsed:.1f}/s "
+                         f"busy {utilisation:.0%} dropped {new_drops / elapsed:.1f}/s")
+
+        summary = " | ".join(parts) + f" | bottleneck: {busiest[0]}"
+        logger.info(summary)
+        return summary
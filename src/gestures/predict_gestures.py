@@ -3,12 +3,24 @@
 import cv2
 import mediapipe as mp
 import numpy as np
+import os
+import sys
 import time
+import signal
+import threading
+import multiprocessing
 import mediapipe as mp
 import tensorflow as tf
-from collections import deque
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics.metrics import Registry
 from . import processing
-from tensorflow.keras.models import load_model
+from . import inference
+from .ring_buffer import RingBuffer
+from .roi import HandROI
+from .gating import MotionGate, IdleScheduler
+from .pipeline import LatestSlot, Stage, PipelineMonitor
+from .sources import CameraSource
 
 
 gesture_list = ["closed_to_open", "open_to_closed", "swipe_left", "swipe_right", "swipe_up", "swipe_down", "one", "two", "three", "four"]
@@ -17,7 +29,34 @@ last_good = None
 class Config:
     SEQUENCE_LENGTH = 20
     CAMERA_PORT = 0 # Default webcam port
+    CAMERA_FPS = 30
     PREDICT_THRESHOLD = 0.7  # How confident the model needs to be in order to say a prediction 
+    PREDICT_STRIDE = 5  # Evaluate the sliding window every k frames
+    PREDICT_COOLDOWN = 1.5  # Seconds to wait after a detection before the next one
+    MODEL_PATH = 'best_gesture_lstm.h5'
+    INFERENCE_BACKEND = "keras"  # "keras" or "tflite" (see export_tflite.py)
+    TFLITE_MODEL_PATH = 'gesture_lstm_int8.tflite'  # Full int8; also gesture_lstm_dynamic_int8 / _float16
+    TFLITE_THREADS = None  # None lets TFLite pick
+    STREAMING = False  # Per-frame stateful LSTM instead of 20-frame windows
+    # Frames since reset before a stream prediction counts. The model only saw
+    # full 20-frame windows in training, so earlier outputs are guesses: fewer
+    # frames fire sooner but misfire more (test replay: 10 -> 87%, 15 -> 99.2%,
+    # 20 -> 99.0%, windowed 99.0%); 15 is the shortest wait at full accuracy
+    STREAM_MIN_FRAMES = 15
+    STREAM_MAX_FRAMES = 40  # Reset the LSTM state if nothing fired by then
+    THREADED = True  # Run capture / landmarks / classify as separate pipeline stages
+    STATS_INTERVAL = 5.0  # Seconds between per-stage throughput logs (0 = off)
+    HEADLESS = False  # No drawing or windows; stop via the stop event / SIGTERM
+    ROI_TRACKING = False  # Feed MediaPipe a crop around the last hand position
+    ROI_PADDING = 0.3  # Margin around the hand box, per side, as a fraction of its size
+    ROI_MIN_SIZE = 160  # Smallest crop side in pixels
+    ROI_LOST_SCALE = 0.5  # Downscale the full frame by this while no hand is tracked
+    MOTION_THRESHOLD = 0.01  # Skip repeat LSTM calls on windows stiller than this (0 = off)
+    IDLE_AFTER = 5.0  # Seconds without a hand before idle mode (0 = never idle)
+    IDLE_EVERY = 1  # In idle mode, run MediaPipe on every Nth frame (wake takes up to N / IDLE_FPS s)
+    IDLE_FPS = 10  # Camera FPS in idle mode
+    MAX_DROPOUT_FRAMES = 5  # Bridge this many frames without a hand, then start a fresh window
+    METRICS_INTERVAL = 1.0  # Seconds between metric snapshots sent to the main process (0 = off)
 
 # A object to store the latest gesture
 class ResultHolder:
@@ -31,30 +70,44 @@ class ResultHolder:
         return self.latest_result
 
 
-def capture_frame(cap):
-    ret, frame = cap.read()
-    if not ret:  # Frame was not successfully captured
-        return None, None
-    return cv2.flip(frame, 1), None  # Flip frame
+# Drop-in for the RingBuffer in streaming mode: every appended frame
+# advances the stateful LSTM by one step and keeps the latest probabilities
+class StreamBuffer:
+    def __init__(self, backend):
+        self.backend = backend
+        self.frames = 0
+        self.probs = None
+
+    def append(self, frame):
+        self.probs = self.backend.step(frame)
+        self.frames += 1
+
+    def clear(self):
+        self.backend.reset()
+        self.frames = 0
+        self.probs = None
 
+    def __len__(self):
+        return self.frames
 
-def process_landmarks(frame, results, buffer, mp_drawing, mp_hands):
+
+def process_landmarks(frame, results, mp_drawing, mp_hands):
     global last_good  # Keep record of last good frame for smoothing
 
     # 1) No detection -> re-use last_good if available
     if not results.multi_hand_landmarks:
-        if last_good is not None:
-            buffer.append(last_good)
-        return frame, buffer
+        return frame, last_good
 
     # 2) We have one or more hands – find the first right hand
+    proc = None
     for idx, hl in enumerate(results.multi_hand_landmarks):
         handedness_label = results.multi_handedness[idx].classification[0].label
         if handedness_label != "Right":
             continue
 
-        # draw the landmarks
-        mp_drawing.draw_landmarks(frame, hl, mp_hands.HAND_CONNECTIONS)
+        # draw the landmarks (skipped when headless)
+        if mp_drawing is not None:
+            mp_drawing.draw_landmarks(frame, hl, mp_hands.HAND_CONNECTIONS)
 
         # flatten to [x0,y0,z0,...,x20,y20,z20]
         coords = [c for lm in hl.landmark for c in (lm.x, lm.y, lm.z)]
@@ -68,15 +121,17 @@ def process_landmarks(frame, results, buffer, mp_drawing, mp_hands):
             lock_axes=(False, False, False)
         )
         last_good = proc
-        
-        buffer.append(proc)
 
-    return frame, buffer
+    return frame, proc
+
 
+def predict(backend, sequence, threshold=0.7):
+    x = np.asarray(sequence, dtype=np.float32)[np.newaxis]  # no copy for a float32 window
+    probs = backend.predict_proba(x)            # shape (10,)
+    return classify(probs, threshold)
 
-def predict(model, sequence, threshold=0.7):
-    x = np.expand_dims(sequence, axis=0).astype(np.float32)
-    probs = model.predict(x)[0]                 # shape (10,)
+
+def classify(probs, threshold=0.7):
     cls  = np.argmax(probs)                     # int in [0..9]
     conf = probs[cls]                           # float in [0..1]
     if conf >= threshold:
@@ -84,81 +139,308 @@ def predict(model, sequence, threshold=0.7):
     return None, None
 
 
-def run_gesture_recognition(q):
-    model = load_model('best_gesture_lstm.h5')
-    cfg   = Config()
-    # cap   = cv2.VideoCapture(cfg.CAMERA_PORT, cv2.CAP_V4L2) # linux / pi
-    cap = cv2.VideoCapture(cfg.CAMERA_PORT) # mac
-    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
-    cap.set(cv2.CAP_PROP_FPS, 30)
-
-    buffer = deque(maxlen=cfg.SEQUENCE_LENGTH)
-    last_predict_at = 0
-    PREDICT_COOLDOWN = 1.5
-
-    last_cls  = None
-    last_conf = 0.0
-
-    mp_hands_mod = mp.solutions.hands
-    mp_kwargs = dict(
-        static_image_mode=False,
-        max_num_hands=1,
-        min_detection_confidence=0.2,
-        min_tracking_confidence=0.2
-    )
-
-    with mp_hands_mod.Hands(**mp_kwargs) as hands:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            frame = cv2.flip(frame, 1)
-            rgb   = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = hands.process(rgb)
-
-            frame, buffer = process_landmarks(
-                frame, results,
-                buffer,
-                mp.solutions.drawing_utils,
-                mp.solutions.hands
-            )
-
-            # Only predict once per cooldown interval
-            if len(buffer) == cfg.SEQUENCE_LENGTH and results.multi_hand_landmarks:
-                now = time.time()
-                if now - last_predict_at > PREDICT_COOLDOWN:
-                    cls, conf = predict(model, list(buffer), cfg.PREDICT_THRESHOLD)
-                    if cls is not None:
-                        last_cls, last_conf = cls, conf
-                        # q.put(gesture_list[last_cls])  # <-- send result to main
-                        q.put({
-                            'gesture_index': int(last_cls),
-                            'confidence': float(last_conf),
-                            'gesture_name': gesture_list[last_cls]
-                        })
-                    buffer.clear()
-                    last_predict_at = now
-
-            # Put the last prediction on every frame
-            if last_cls is not None:
-                cv2.putText(
-                    frame,
-                    f"{gesture_list[last_cls]} ({last_conf:.2f})",
-                    (10, 30),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    1,
-                    (0, 0, 255),
-                    2
-                )
-
-            cv2.imshow("Live", frame)
-            if cv2.waitKey(1) == 27:
-                break
-            
-    cap.release()
-    cv2.destroyAllWindows()
+def send_result(q, cls, conf, timestamp=None):
+    # q.put(gesture_list[cls])  # <-- send result to main
+    q.put({
+        'gesture_index': int(cls),
+        'confidence': float(conf),
+        'gesture_name': gesture_list[cls],
+        'timestamp': time.time() if timestamp is None else timestamp,
+        'sent_at': time.time()  # wall clock, for queue transit time
+    })
+
+
+# Buffering, cooldown and prediction for a stream of landmark frames.
+# Fed one frame at a time; sends detected gestures to the result queue.
+class Recognizer:
+    def __init__(self, cfg, backend, q):
+        self.cfg = cfg
+        self.backend = backend
+        self.q = q
+        if cfg.STREAMING:
+            self.buffer = StreamBuffer(backend)
+        else:
+            self.buffer = RingBuffer(cfg.SEQUENCE_LENGTH)
+        self.last_predict_at = float("-inf")  # so a replay starting at t=0 can fire
+        self.last_eval_at = 0  # buffer.appended at the last window evaluation
+        self.last_cls = None
+        self.last_conf = 0.0
+        self.frames = 0
+        self.missing = 0  # consecutive frames without a hand
+        self.gate = MotionGate(cfg.MOTION_THRESHOLD)
+        self.inference_seconds = None  # model time spent on the last frame, if any
+        self.evaluated = False  # whether the last frame's output was checked against the threshold
+
+    # proc: this frame's preprocessed landmarks (None if there are none)
+    # hand_present: whether MediaPipe saw a hand in this frame
+    # now: the frame's source timestamp (defaults to the wall clock)
+    def update(self, proc, hand_present, now=None):
+        now = time.time() if now is None else now
+        self.frames += 1
+        self.inference_seconds = None
+        self.evaluated = False
+
+        # short dropouts are bridged with the last good landmarks; after a
+        # longer one the window would only hold the stale pose, so drop it
+        self.missing = 0 if hand_present else self.missing + 1
+        if self.missing > self.cfg.MAX_DROPOUT_FRAMES:
+            if len(self.buffer):
+                self.buffer.clear()
+                self.gate.reset()
+        elif proc is not None:
+            start = time.perf_counter()
+            self.buffer.append(proc)
+            if self.cfg.STREAMING:
+                self.inference_seconds = time.perf_counter() - start
+        if self.cfg.STREAMING:
+            return self._update_streaming(hand_present, now)
+        return self._update_windowed(hand_present, now)
+
+    def _update_streaming(self, hand_present, now):
+        cfg, buffer = self.cfg, self.buffer
+
+        # Every frame already produced a distribution; fire as soon as
+        # one is confident, then start the next gesture from scratch
+        if len(buffer) >= cfg.STREAM_MAX_FRAMES:
+            buffer.clear()
+        if len(buffer) < cfg.STREAM_MIN_FRAMES or not hand_present:
+            return None
+        if now - self.last_predict_at <= cfg.PREDICT_COOLDOWN:
+            return None
+
+        cls, conf = classify(buffer.probs, cfg.PREDICT_THRESHOLD)
+        self.evaluated = True
+        if cls is None:
+            return None
+        buffer.clear()
+        return self._emit(cls, conf, now)
+
+    def _update_windowed(self, hand_present, now):
+        cfg, buffer = self.cfg, self.buffer
+
+        # Evaluate the overlapping window every PREDICT_STRIDE frames,
+        # and only fire once per cooldown interval
+        if not (buffer.is_full() and hand_present
+                and buffer.appended - self.last_eval_at >= cfg.PREDICT_STRIDE):
+            return None
+        if now - self.last_predict_at <= cfg.PREDICT_COOLDOWN:
+            return None
+
+        self.last_eval_at = buffer.appended
+        if not self.gate.should_classify(buffer.window()):
+            return None
+        start = time.perf_counter()
+        cls, conf = predict(self.backend, buffer.window(), cfg.PREDICT_THRESHOLD)
+        self.inference_seconds = time.perf_counter() - start
+        self.evaluated = True
+        if cls is None:
+            return None
+        return self._emit(cls, conf, now)
+
+    def _emit(self, cls, conf, now):
+        self.last_cls, self.last_conf = cls, conf
+        self.last_predict_at = now
+        send_result(self.q, cls, conf, now)
+        return cls, conf
+
+
+# Put the last prediction on the frame and show it; True when ESC is pressed
+def show_frame(frame, recognizer):
+    if recognizer.last_cls is not None:
+        cv2.putText(
+            frame,
+            f"{gesture_list[recognizer.last_cls]} ({recognizer.last_conf:.2f})",
+            (10, 30),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            1,
+            (0, 0, 255),
+            2
+        )
+
+    cv2.imshow("Live", frame)
+    return cv2.waitKey(1) == 27
+
+
+# q: result queue for the main process
+# stop_event: threading/multiprocessing Event that shuts the recognizer down
+#             (the only way to stop it when headless, besides SIGTERM)
+# headless: overrides Config.HEADLESS (always headless for landmark replays)
+# source: where frames come from (see sources.py), the camera by default;
+#         the recognizer stops when it runs out of frames
+# cfg: Config instance to use instead of the defaults
+# on_packet: called with every classified Packet, e.g. to collect timings
+# returns {"frames", "seconds", "fps"} for the frames that were classified
+def run_gesture_recognition(q, stop_event=None, headless=None, source=None,
+                            cfg=None, on_packet=None):
+    cfg   = cfg if cfg is not None else Config()
+    headless = cfg.HEADLESS if headless is None else headless
+    stop = stop_event if stop_event is not None else threading.Event()
+    if source is None:
+        source = CameraSource(cfg.CAMERA_PORT, cfg.CAMERA_FPS)
+    if source.provides_landmarks:
+        headless = True  # replayed landmarks have nothing to draw on
+
+    # process.terminate() sends SIGTERM; turn it into a clean shutdown
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        # Ctrl+C reaches the whole process group; as a child process, leave
+        # it to the parent, which stops us through stop_event
+        if multiprocessing.parent_process() is not None:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if cfg.STREAMING:
+        backend = inference.StreamingBackend(cfg.MODEL_PATH)
+    else:
+        backend = inference.load_backend(cfg)
+    backend.warmup()  # trace/allocate now instead of on the first gesture
+    recognizer = Recognizer(cfg, backend, q)
+
+    mp_hands_mod, mp_drawing, hands = None, None, None
+    if not source.provides_landmarks:
+        mp_hands_mod = mp.solutions.hands
+        mp_drawing = None if headless else mp.solutions.drawing_utils
+        mp_kwargs = dict(
+            static_image_mode=False,
+            max_num_hands=1,
+            min_detection_confidence=0.2,
+            min_tracking_confidence=0.2
+        )
+        hands = mp_hands_mod.Hands(**mp_kwargs)
+    roi = None
+    if cfg.ROI_TRACKING:
+        roi = HandROI(cfg.ROI_PADDING, cfg.ROI_MIN_SIZE, cfg.ROI_LOST_SCALE)
+    idle = None
+    if cfg.IDLE_AFTER > 0:
+        idle = IdleScheduler(cfg.IDLE_AFTER, cfg.IDLE_EVERY, cfg.IDLE_FPS,
+                             cfg.CAMERA_FPS)
+
+    # Metrics live in this process; snapshots go to the main process over
+    # the result queue every METRICS_INTERVAL seconds
+    metrics = Registry()
+    slots = []  # pipeline hand-offs whose drops are counted
+    flushed = {"at": time.perf_counter(), "dropped": 0}
+
+    def flush_metrics():
+        dropped = sum(slot.dropped for slot in slots)
+        metrics.inc("gesture_frames_dropped_total", dropped - flushed["dropped"])
+        flushed["at"], flushed["dropped"] = time.perf_counter(), dropped
+        q.put({'type': 'metrics', 'snapshot': metrics.snapshot(reset=True)})
+
+    # Stage work: each takes and returns a Packet
+    def capture(_):
+        if idle is not None:
+            fps = idle.fps_change()
+            if fps is not None:
+                source.set_fps(fps)
+        start = time.perf_counter()
+        packet = source.read()
+        if packet is None:
+            stop.set()
+            return None
+        packet.timings["capture"] = time.perf_counter() - start
+        return packet
+
+    def landmarks(packet):
+        if packet.results is None:  # replayed sources come with landmarks
+            if idle is not None and not idle.should_process():
+                return None  # idle: skip this frame entirely
+            start = time.perf_counter()
+            if roi is None:
+                rgb = cv2.cvtColor(packet.frame, cv2.COLOR_BGR2RGB)
+                packet.results = hands.process(rgb)
+            else:
+                # crop (or downscale) first so color conversion is cheaper too
+                image, transform = roi.prepare(packet.frame)
+                packet.results = hands.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+                roi.update(packet.results, transform, packet.frame.shape)
+            packet.timings["mediapipe"] = time.perf_counter() - start
+            if idle is not None:
+                idle.update(bool(packet.results.multi_hand_landmarks))
+        start = time.perf_counter()
+        packet.frame, packet.proc = process_landmarks(
+            packet.frame, packet.results, mp_drawing, mp_hands_mod)
+        packet.timings["preprocess"] = time.perf_counter() - start
+        return packet
+
+    def recognize(packet):
+        start = time.perf_counter()
+        result = recognizer.update(packet.proc, bool(packet.results.multi_hand_landmarks),
+                                   packet.timestamp)
+        done = time.perf_counter()
+        packet.timings["classify"] = done - start
+        if recognizer.inference_seconds is not None:
+            packet.timings["predict"] = recognizer.inference_seconds
+        packet.timings["total"] = done - packet.stamps["capture"]
+        if on_packet is not None:
+            on_packet(packet)
+
+        if cfg.METRICS_INTERVAL:
+            metrics.inc("gesture_frames_total")
+            for step, seconds in packet.timings.items():
+                metrics.observe("gesture_stage_seconds", seconds, stage=step)
+            if recognizer.evaluated:
+                metrics.inc("gesture_predictions_total")
+                metrics.inc("gesture_rejects_total" if result is None
+                            else "gesture_detections_total")
+            if done - flushed["at"] >= cfg.METRICS_INTERVAL:
+                flush_metrics()
+        return packet
+
+    started_at = time.perf_counter()
+    try:
+        if cfg.THREADED:
+            # Each stage keeps only the newest frame from the one before, so
+            # the slowest stage sets the rate without stale frames piling up
+            frames, found, display = LatestSlot(), LatestSlot(), LatestSlot()
+            slots.extend((frames, found))  # display drops are expected
+            stages = [
+                Stage("capture", capture, stop, outboxes=(frames,)),
+                Stage("landmarks", landmarks, stop, inbox=frames,
+                      outboxes=(found,) if headless else (found, display)),
+                Stage("classify", recognize, stop, inbox=found),
+            ]
+            for stage in stages:
+                stage.start()
+            monitor = PipelineMonitor(stages, cfg.STATS_INTERVAL)
+
+            # GUI calls stay on this thread
+            while not stop.is_set():
+                if headless:
+                    stop.wait(0.1)
+                else:
+                    packet = display.get(timeout=0.1)
+                    if packet is not None and show_frame(packet.frame, recognizer):
+                        stop.set()
+                monitor.poll()
+
+            stop.set()
+            for stage in stages:
+                stage.join(timeout=1.0)
+        else:
+            while not stop.is_set():
+                packet = capture(None)
+                if packet is None:
+                    break
+                if landmarks(packet) is not None:
+                    recognize(packet)
+                if not headless and show_frame(packet.frame, recognizer):
+                    break
+    finally:
+        if hands is not None:
+            hands.close()
+        source.release()
+        if cfg.METRICS_INTERVAL:
+            flush_metrics()
+        if not headless:
+            cv2.destroyAllWindows()
+
+    seconds = time.perf_counter() - started_at
+    return {
+        "frames": recognizer.frames,
+        "seconds": seconds,
+        "fps": recognizer.frames / seconds if seconds > 0 else 0.0
+    }
     
     
 if __name__ == "__main__":
     run_gesture_recognition()
-
@@ -7,17 +7,9 @@ import numpy as np
 
 def center_landmarks(frame):
     frame = np.array(frame)
-    # Get wrist coordinates
-    wrist_x = frame[0]
-    wrist_y = frame[1]
-    wrist_z = frame[2]
-    centered = frame.copy()
-    for i in range(21):  # Loop through the 21 landmarks
-        # Center relative to wrist
-        centered[i*3 + 0] -= wrist_x
-        centered[i*3 + 1] -= wrist_y
-        centered[i*3 + 2] -= wrist_z
-    return centered
+    # Center relative to wrist (broadcast over the 21 landmarks)
+    centered = frame.reshape(21, 3) - frame[:3]
+    return centered.reshape(-1)
 
 
 # Wrist and middle finger MCP joint
@@ -39,41 +31,17 @@ def normalize_hand_size(frame, ref_start=0, ref_end=9):
 
 
 def normalize_wrist_angle(frame_vector, ref_start=0, ref_end=5):
-    # 1) reshape to (21, 3) so we can index x,y easily
+    # reshape to (21, 3), rotate so ref_start -> ref_end points along +Y,
+    # then flatten back to a 63-vector
     pts = np.array(frame_vector, dtype=float).reshape(21, 3)
-
-    # 2) get the 2D vector from landmark ref_start to ref_end
-    p0 = pts[ref_start, :2]  # [x0, y0]
-    p5 = pts[ref_end, :2]  # [x5, y5]
-    V = p5 - p0            # vector in the XY plane
-
-    # 3) signed angle between V and positive Y axis:
-    #    angle = atan2(Vx, Vy)
-    angle = np.arctan2(V[0], V[1])
-
-    # 4) rotation matrix to “undo” that angle
-    c, s = np.cos(-angle), np.sin(-angle)
-    R = np.array([[c, -s],
-                  [s,  c]])
-
-    # 5) translate pts so p0 is origin, rotate, then translate back
-    xy = pts[:, :2] - p0      # shift origin
-    xy = xy.dot(R.T)          # rotate in-plane
-    pts[:, :2] = xy + p0      # shift back
-
-    # 6) flatten back to 63-vector
+    _rotate_to_vertical(pts, ref_start, ref_end)
     return pts.reshape(-1)
 
 
 def lock_movement(frame, lock_x=False, lock_y=False, lock_z=False):
     frame = np.array(frame)
-    for i in range(21):  # Loop through the 21 landmarks
-        if lock_x:
-            frame[i*3 + 0] = 0.0
-        if lock_y:
-            frame[i*3 + 1] = 0.0
-        if lock_z:
-            frame[i*3 + 2] = 0.0
+    pts = frame.reshape(21, 3)  # view, so writes land in frame
+    _lock_axes(pts, (lock_x, lock_y, lock_z))
     return frame
 
 
@@ -90,22 +58,99 @@ def preprocess_frame(frame,
                      rotate=False,
                      scale=True,
                      lock_axes=(False, False, False)):
-    # 1) Copy
-    pts = np.array(frame, dtype=float)
-
-    # 2) Center (e.g. subtract your chosen origin)
+    # Copy once, then run the batched steps in place on a (1, 63) view
+    pts = np.array(frame, dtype=float).reshape(1, -1)
+    preprocess_sequence(pts, center, rotate, scale, lock_axes, out=pts)
+    return pts[0]
+
+
+# Vectorized version of preprocess_frame for a whole (T, 63) sequence
+# args:
+#     sequence: array-like of shape (T, 63)
+#     out: optional float buffer with the same shape to write into
+#          (pass the input itself to preprocess in place)
+# returns a float32 array unless `out` says otherwise
+def preprocess_sequence(sequence,
+                        center=True,
+                        rotate=False,
+                        scale=True,
+                        lock_axes=(False, False, False),
+                        out=None):
+    sequence = np.asarray(sequence)
+    if sequence.ndim != 2 or sequence.shape[-1] != 63:
+        raise ValueError(
+            f"Expected sequence of shape (T, 63), got {sequence.shape}")
+    return _preprocess(sequence, center, rotate, scale, lock_axes, out)
+
+
+# Vectorized preprocessing for a (N, T, 63) batch of sequences
+def preprocess_batch(batch,
+                     center=True,
+                     rotate=False,
+                     scale=True,
+                     lock_axes=(False, False, False),
+                     out=None):
+    batch = np.asarray(batch)
+    if batch.ndim != 3 or batch.shape[-1] != 63:
+        raise ValueError(
+            f"Expected batch of shape (N, T, 63), got {batch.shape}")
+    return _preprocess(batch, center, rotate, scale, lock_axes, out)
+
+
+def _preprocess(arr, center, rotate, scale, lock_axes, out):
+    # 1) Copy into the output buffer (skipped when preprocessing in place)
+    if out is None:
+        out = arr.astype(np.float32)
+    elif out is not arr:
+        if out.shape != arr.shape:
+            raise ValueError(
+                f"out has shape {out.shape}, expected {arr.shape}")
+        np.copyto(out, arr, casting="same_kind")
+
+    # View as (..., 21, 3); raises instead of silently copying
+    pts = out.view()
+    pts.shape = out.shape[:-1] + (21, 3)
+
+    # 2) Center on the wrist
     if center:
-        pts = center_landmarks(pts)
+        pts -= pts[..., :1, :].copy()
 
-    # 3) Rotate so forearm is vertical
+    # 3) Rotate so wrist -> index MCP points along +Y (normalize_wrist_angle)
     if rotate:
-        pts = normalize_wrist_angle(pts)
+        _rotate_to_vertical(pts)
 
-    # 4) Uniformly scale to canonical hand size
+    # 4) Uniformly scale to canonical hand size (wrist -> middle MCP)
     if scale:
-        pts = normalize_hand_size(pts)
+        hand_scale = np.linalg.norm(pts[..., 9, :] - pts[..., 0, :], axis=-1)
+        hand_scale[hand_scale == 0] = 1e-6
+        pts /= hand_scale[..., None, None]
 
     # 5) Finally, zero out any axes you want locked
-    pts = lock_movement(pts, *lock_axes)
+    _lock_axes(pts, lock_axes)
+
+    return out
+
+
+def _rotate_to_vertical(pts, ref_start=0, ref_end=5):
+    v = pts[..., ref_end, :2] - pts[..., ref_start, :2]
+    # signed angle between v and +Y; rotating by -angle undoes it
+    angle = np.arctan2(v[..., 0], v[..., 1])
+    rotate_in_plane(pts, -angle, ref_start)
+
+
+# Rotate (..., 21, 3) landmarks in place by `angle` radians (shape (...),
+# one per hand) in the XY plane about landmark `ref`
+def rotate_in_plane(pts, angle, ref=0):
+    origin = pts[..., ref, :2].copy()
+    c = np.cos(angle)[..., None]
+    s = np.sin(angle)[..., None]
+    x = pts[..., 0] - origin[..., None, 0]
+    y = pts[..., 1] - origin[..., None, 1]
+    pts[..., 0] = c * x - s * y + origin[..., None, 0]
+    pts[..., 1] = s * x + c * y + origin[..., None, 1]
+
 
-    return pts
+def _lock_axes(pts, lock_axes):
+    for axis, locked in enumerate(lock_axes):
+        if locked:
+            pts[..., axis] = 0.0
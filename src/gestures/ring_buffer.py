@@ -0,0 +1,39 @@
+# ring_buffer.py
+# Author: Caden Calderon
+# Fixed-size sliding window of preprocessed frames for the live recognizer.
+
+import numpy as np
+
+
+# Preallocated (length, 63) float32 ring buffer. Every slot is stored twice
+# (at i and i + length) so the current window, oldest frame first, is always
+# one contiguous slice: window() is a view, appending never allocates.
+class RingBuffer:
+    def __init__(self, length, num_features=63, dtype=np.float32):
+        self.length = length
+        self.data = np.zeros((2 * length, num_features), dtype=dtype)
+        self.pos = 0          # slot the next frame goes into (= oldest frame)
+        self.count = 0        # frames currently held (up to length)
+        self.appended = 0     # frames appended since creation, for strides
+
+    def append(self, frame):
+        self.data[self.pos] = frame
+        self.data[self.pos + self.length] = frame
+        self.pos = (self.pos + 1) % self.length
+        self.count = min(self.count + 1, self.length)
+        self.appended += 1
+
+    def clear(self):
+        self.pos = 0
+        self.count = 0
+
+    def is_full(self):
+        return self.count == self.length
+
+    # (length, 63) view of the window, oldest frame first; only meaningful
+    # once the buffer is full
+    def window(self):
+        return self.data[self.pos:self.pos + self.length]
+
+    def __len__(self):
+        return self.count
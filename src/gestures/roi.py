@@ -0,0 +1,59 @@
+# roi.py
+# Author: Caden Calderon
+# Hand region-of-interest tracking for MediaPipe. While a hand is tracked,
+# only a padded crop around its last position is processed; when it is
+# lost, a downscaled full frame is used to find it again. Landmarks are
+# mapped back into full-frame normalized coordinates, so everything
+# downstream (drawing, preprocessing, the model) sees the same values.
+
+import cv2
+
+
+class HandROI:
+    def __init__(self, padding=0.3, min_size=160, lost_scale=0.5):
+        self.padding = padding        # Extra margin around the hand, per side, as a fraction of its size
+        self.min_size = min_size      # Smallest crop side in pixels
+        self.lost_scale = lost_scale  # Downscale factor for the search frame when no hand is tracked
+        self.box = None               # (x0, y0, x1, y1) crop in full-frame pixels
+
+    # image to hand MediaPipe, plus the (x, y, width, height) it covers in
+    # normalized full-frame coordinates
+    def prepare(self, frame):
+        height, width = frame.shape[:2]
+        if self.box is None:
+            if self.lost_scale < 1.0:
+                frame = cv2.resize(frame, None, fx=self.lost_scale,
+                                   fy=self.lost_scale, interpolation=cv2.INTER_AREA)
+            return frame, (0.0, 0.0, 1.0, 1.0)
+
+        x0, y0, x1, y1 = self.box
+        transform = (x0 / width, y0 / height, (x1 - x0) / width, (y1 - y0) / height)
+        return frame[y0:y1, x0:x1], transform
+
+    # remap the landmarks of `results` (in place) from the prepared image into
+    # full-frame coordinates and move the crop to where the hand is now
+    def update(self, results, transform, frame_shape):
+        if not results.multi_hand_landmarks:
+            self.box = None
+            return
+
+        ox, oy, sx, sy = transform
+        xs, ys = [], []
+        for hl in results.multi_hand_landmarks:
+            for lm in hl.landmark:
+                lm.x = ox + lm.x * sx
+                lm.y = oy + lm.y * sy
+                lm.z = lm.z * sx  # z shares x's (image width) scale
+                xs.append(lm.x)
+                ys.append(lm.y)
+
+        # next crop: padded square around the hand, clamped to the frame
+        height, width = frame_shape[:2]
+        cx = (min(xs) + max(xs)) / 2 * width
+        cy = (min(ys) + max(ys)) / 2 * height
+        side = max((max(xs) - min(xs)) * width, (max(ys) - min(ys)) * height)
+        side = max(side * (1 + 2 * self.padding), self.min_size)
+
+        x0, x1 = int(max(0, cx - side / 2)), int(min(width, cx + side / 2))
+        y0, y1 = int(max(0, cy - side / 2)), int(min(height, cy + side / 2))
+        self.box = (x0, y0, x1, y1) if x1 - x0 > 1 and y1 - y0 > 1 else None
@@ -0,0 +1,161 @@
+# sources.py
+# Author: Caden Calderon
+# Where the recognizer's frames come from. The live camera is one source; a
+# recorded video or stored landmark sequences from collected_data can be
+# replayed through the same pipeline, so runs are repeatable and need no
+# camera. Every source hands out Packets stamped with its own clock, which
+# the recognizer uses for cooldowns (a replay runs on video time, not wall
+# time, however fast it is processed).
+
+import time
+from types import SimpleNamespace
+import cv2
+import numpy as np
+from . import dataset
+from .pipeline import Packet
+
+
+# Read one frame from an open capture and mirror it like the live preview;
+# None when no frame could be read
+def read_flipped(cap):
+    ret, frame = cap.read()
+    if not ret:  # Frame was not successfully captured
+        return None
+    return cv2.flip(frame, 1)  # Flip frame
+
+
+class CameraSource:
+    provides_landmarks = False
+
+    def __init__(self, port=0, fps=30):
+        # self.cap = cv2.VideoCapture(port, cv2.CAP_V4L2) # linux / pi
+        self.cap = cv2.VideoCapture(port) # mac
+        self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        self.cap.set(cv2.CAP_PROP_FPS, fps)
+
+    def read(self):
+        frame = read_flipped(self.cap)
+        return None if frame is None else Packet(frame)
+
+    def set_fps(self, fps):
+        self.cap.set(cv2.CAP_PROP_FPS, fps)
+
+    def release(self):
+        self.cap.release()
+
+
+# Frames from a recorded video file, timestamped at the file's frame rate.
+# flip=True mirrors them like the camera, for videos recorded unmirrored.
+class VideoFileSource:
+    provides_landmarks = False
+
+    def __init__(self, path, flip=True, realtime=False):
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise FileNotFoundError(f"Could not open video {path}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.flip = flip
+        self.realtime = realtime  # pace reads at the file's frame rate
+        self.index = 0
+        self.started_at = None
+
+    def read(self):
+        if self.flip:
+            frame = read_flipped(self.cap)
+        else:
+            ret, frame = self.cap.read()
+            frame = frame if ret else None
+        if frame is None:
+            return None
+
+        timestamp = self.index / self.fps
+        _pace(self, timestamp)
+        self.index += 1
+        return Packet(frame, timestamp)
+
+    def set_fps(self, fps):
+        pass  # a file plays at its own rate
+
+    def release(self):
+        self.cap.release()
+
+
+# Replays preprocessed landmark sequences as if MediaPipe had found them:
+# each sequence is preceded by `gap` frames without a hand, and every frame
+# carries a MediaPipe-shaped result, so only hands.process() is skipped.
+# events lists (start, end, label) in source seconds for scoring detections.
+class LandmarkReplaySource:
+    provides_landmarks = True
+
+    def __init__(self, sequences, labels, fps=30, gap=30, realtime=False,
+                 frame_shape=(480, 640, 3)):
+        self.sequences = sequences
+        self.labels = labels
+        self.fps = fps
+        self.gap = gap
+        self.realtime = realtime
+        self.frame = np.zeros(frame_shape, dtype=np.uint8)
+        self.started_at = None
+
+        # flat schedule of (sequence, frame) per source frame, -1 for no hand
+        self.schedule = []
+        self.events = []
+        for i, sequence in enumerate(sequences):
+            self.schedule.extend([(-1, -1)] * gap)
+            start = len(self.schedule) / fps
+            self.schedule.extend((i, t) for t in range(len(sequence)))
+            self.events.append((start, len(self.schedule) / fps, int(labels[i])))
+        self.index = 0
+
+    # `limit` sequences of one packed partition, shuffled so consecutive
+    # gestures differ like they would live
+    @classmethod
+    def from_pack(cls, partition="test", pack_dir=dataset.PACK_DIR, limit=None,
+                  seed=0, **kwargs):
+        X, y = dataset.load_packed(partition, pack_dir)
+        order = np.random.default_rng(seed).permutation(len(X))[:limit]
+        return cls(X[order], y[order], **kwargs)
+
+    def read(self):
+        if self.index >= len(self.schedule):
+            return None
+        timestamp = self.index / self.fps
+        _pace(self, timestamp)
+        i, t = self.schedule[self.index]
+        self.index += 1
+
+        packet = Packet(self.frame, timestamp)
+        if i < 0:
+            packet.results = SimpleNamespace(multi_hand_landmarks=None,
+                                             multi_handedness=None)
+        else:
+            packet.results = _hand_result(self.sequences[i][t])
+        return packet
+
+    def set_fps(self, fps):
+        pass
+
+    def release(self):
+        pass
+
+
+# MediaPipe-shaped result holding one right hand with the given (63,) landmarks
+def _hand_result(coords):
+    points = np.asarray(coords, dtype=np.float64).reshape(21, 3)
+    landmark = [SimpleNamespace(x=x, y=y, z=z) for x, y, z in points.tolist()]
+    handedness = SimpleNamespace(classification=[SimpleNamespace(label="Right")])
+    return SimpleNamespace(multi_hand_landmarks=[SimpleNamespace(landmark=landmark)],
+                           multi_handedness=[handedness])
+
+
+# sleep until `timestamp` source seconds after the first read, for sources
+# replayed in real time
+def _pace(source, timestamp):
+    if not source.realtime:
+        return
+    now = time.perf_counter()
+    if source.started_at is None:
+        source.started_at = now - timestamp
+    delay = source.started_at + timestamp - now
+    if delay > 0:
+        time.sleep(delay)
@@ -8,10 +8,13 @@ from constants.constants import (
 )
 from controller.controller_manager import ControllerManager
 from gestures.predict_gestures import run_gesture_recognition, ResultHolder
+from metrics.metrics import REGISTRY, MetricsServer
 import logging
 import time
 import sys
 import os
+import signal
+import argparse
 import multiprocessing
 from queue import Empty
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -23,49 +26,99 @@ logger = logging.getLogger(__name__)
 
 
 class MainProgram:
-    def __init__(self, result_holder=None, queue=None):
+    def __init__(self, result_holder=None, queue=None, headless=False,
+                 metrics_port=9108, metrics_host="127.0.0.1"):
         # stores the most recent result
         self.result_holder = result_holder if result_holder else ResultHolder()
         self.queue = queue if queue else multiprocessing.Queue()  # inter-process result queue
         self.gesture_process = None
+        self.stop_event = None  # tells the gesture process to shut down
+        self.headless = headless  # no OpenCV windows in the gesture process
+        self.metrics = REGISTRY
+
+        # Prometheus endpoint at http://<host>:<port>/metrics (port 0 = off)
+        self.metrics_server = None
+        if metrics_port:
+            self.metrics_server = MetricsServer(self.metrics, metrics_host, metrics_port)
+            try:
+                self.metrics_server.start()
+            except OSError as e:
+                logger.error(f"Failed to start metrics endpoint: {str(e)}")
+                self.metrics_server = None
 
         self.controller_manager = ControllerManager()
 
         if not self.controller_manager.has_available_controllers():
             logger.warning("No controllers are available")
 
+    # handle one message from the gesture process: metric snapshots are
+    # merged into the served metrics, everything else is a gesture result
+    def receive(self, message):
+        if isinstance(message, dict) and message.get('type') == 'metrics':
+            self.metrics.merge(message['snapshot'])
+            return
+        self.result_holder.update(message)
+        self.process_result(message)
+
     def process_result(self, result):
         print(f"Received result: {result}")
         if isinstance(result, dict) and 'gesture_index' in result:
+            if 'sent_at' in result:
+                self.metrics.observe("gesture_stage_seconds",
+                                     max(0.0, time.time() - result['sent_at']), stage="queue")
             gesture_index = result['gesture_index']
             print(
                 f"Detected gesture: {GESTURE_LIST[gesture_index]} (index: {gesture_index})")
 
-            # Let the controller manager handle the gesture
-            success, info = self.controller_manager.handle_gesture(
+            # Hand the gesture to the controller manager; commands run on
+            # the controller's own thread and report back via completions
+            start = time.perf_counter()
+            success, info = self.controller_manager.dispatch_gesture(
                 gesture_index)
+            self.metrics.observe("gesture_stage_seconds", time.perf_counter() - start,
+                                 stage="dispatch")
 
             if success and info:
                 # Handle different result types
                 if info["type"] == "switch":
                     print(
                         f"Switched to {info['controller'].upper()} controller")
-                elif info["type"] == "command":
-                    controller = info["controller"]
-                    command = info["command"]
-                    description = info["description"]
-                    print(f"{controller.capitalize()}: {command} ({description})")
+                elif info["type"] == "queued":
+                    print(f"{info['controller'].capitalize()}: {info['command']} queued")
         else:
             logger.warning(f"Received invalid result format: {result}")
 
+    # report commands that finished since the last call; never blocks
+    def process_completions(self):
+        for completion in self.controller_manager.poll_completions():
+            self.metrics.observe("gesture_stage_seconds", completion["queued_seconds"],
+                                 stage="command_queue")
+            self.metrics.observe("gesture_stage_seconds", completion["run_seconds"],
+                                 stage="handle_gesture")
+
+            controller = completion["controller"]
+            command = completion["command"]
+            merged = completion.get("merged", 1)
+            if completion.get("cancelled"):
+                print(f"{controller.capitalize()}: {merged} queued {command} commands cancelled out")
+            elif completion.get("shed"):
+                logger.warning(f"{controller.capitalize()}: {command} dropped, queued too long")
+            elif completion["success"]:
+                description = completion["description"]
+                note = f", {merged} gestures merged" if merged > 1 else ""
+                print(f"{controller.capitalize()}: {command} ({description}{note})")
+            else:
+                logger.warning(f"{controller.capitalize()}: {command} failed")
+
     def start_gesture_recognition(self):
         if self.gesture_process is not None and self.gesture_process.is_alive():
             logger.warning("Gesture recognition process already running")
             return
 
+        self.stop_event = multiprocessing.Event()
         self.gesture_process = multiprocessing.Process(
             target=run_gesture_recognition,
-            args=(self.queue,),
+            args=(self.queue, self.stop_event, self.headless),
             daemon=True
         )
         self.gesture_process.start()
@@ -75,8 +128,12 @@ class MainProgram:
         if self.gesture_process is None:
             return
 
-        self.gesture_process.terminate()
-        self.gesture_process.join(timeout=1.0)
+        # ask the worker to release the camera and exit, then make sure
+        self.stop_event.set()
+        self.gesture_process.join(timeout=3.0)
+        if self.gesture_process.is_alive():
+            self.gesture_process.terminate()
+            self.gesture_process.join(timeout=1.0)
         self.gesture_process = None
         logger.info("Gesture recognition process stopped")
 
@@ -154,6 +211,11 @@ class MainProgram:
                 print("-" * 50)
                 print(
                     f"Current mode: {active_controller.upper() if active_controller else 'None'}")
+                budgets = self.controller_manager.rate_budgets()
+                print("Controllers: " + ", ".join(
+                    f"{name} {status}" + (f" ({budgets[name]['remaining']}/{budgets[name]['limit']}"
+                                          " requests left)" if name in budgets else "")
+                    for name, status in self.controller_manager.status.items()))
                 print("1. Start gesture recognition")
                 print("2. Stop gesture recognition")
                 print("3. Manual control")
@@ -173,10 +235,10 @@ class MainProgram:
                     listening = True
                     while listening:
                         try:
+                            self.process_completions()
                             # Check for new gestures with a small timeout
                             result = self.queue.get(timeout=0.1)
-                            self.result_holder.update(result)
-                            self.process_result(result)
+                            self.receive(result)
                         except Empty:
                             # No new gesture, continue waiting
                             continue
@@ -213,28 +275,70 @@ class MainProgram:
                 continue
 
         self.stop_gesture_recognition()
+        self.controller_manager.shutdown()
         print("\nExiting program. Goodbye!")
 
+    # Non-interactive loop for running as a service (no menu, no windows).
+    # SIGTERM / SIGINT stop the gesture process cleanly and return.
+    def run_headless(self):
+        if not self.controller_manager.has_available_controllers():
+            logger.error("No controllers available. Please check your configuration.")
+            return
+
+        shutdown = {"requested": False}
+
+        def request_shutdown(signum, frame):
+            shutdown["requested"] = True
+
+        signal.signal(signal.SIGTERM, request_shutdown)
+        signal.signal(signal.SIGINT, request_shutdown)
+
+        self.start_gesture_recognition()
+        logger.info("Running headless, send SIGTERM or SIGINT to stop")
+        try:
+            while not shutdown["requested"]:
+                self.process_completions()
+                if not self.gesture_process.is_alive():
+                    logger.error("Gesture recognition process exited")
+                    break
+                try:
+                    result = self.queue.get(timeout=0.1)
+                except Empty:
+                    continue
+                self.receive(result)
+        finally:
+            self.stop_gesture_recognition()
+            self.controller_manager.shutdown()
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gesture Control System")
+    parser.add_argument("--headless", action="store_true",
+                        help="no OpenCV windows or menu; stop with SIGTERM/SIGINT")
+    parser.add_argument("--metrics-port", type=int, default=9108,
+                        help="port for the Prometheus /metrics endpoint (0 = off)")
+    parser.add_argument("--metrics-host", default="127.0.0.1",
+                        help="address to serve metrics on (0.0.0.0 to scrape from other hosts)")
+    args = parser.parse_args()
+
     # Create a queue for passing results from the worker
     queue = multiprocessing.Queue()
     holder = ResultHolder()  # Instantiate a holder to keep track of the latest gesture
 
-    main_program = MainProgram(holder, queue)
+    main_program = MainProgram(holder, queue, headless=args.headless,
+                               metrics_port=args.metrics_port,
+                               metrics_host=args.metrics_host)
+
+    if args.headless:
+        main_program.run_headless()
+        sys.exit(0)
 
     # Spawn the worker process that captures & predicts gestures continually
-    process = multiprocessing.Process(
-        target=run_gesture_recognition,
-        args=(queue,),
-        daemon=True
-    )
-    process.start()
+    main_program.start_gesture_recognition()
 
     # Start the main loop to consume and handle results
     try:
         main_program.run()
     finally:
         # Cleanup when main loop exits
-        process.terminate()
-        process.join()
+        main_program.stop_gesture_recognition()
@@ -0,0 +1,208 @@
+# metrics.py
+# Author: Andrew Aberer
+# Latency histograms and counters for the hand → command path, served in the
+# Prometheus text format from a small local HTTP endpoint.
+#
+# The gesture process keeps its own Registry and sends snapshots of it over
+# the result queue; the main process merges them into REGISTRY, which is
+# what the endpoint serves.
+
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds (0.5 ms .. 10 s)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Help text for every metric this project records
+METRIC_HELP = {
+    "gesture_stage_seconds": "Time spent in each step between a frame and a command",
+    "gesture_frames_total": "Frames that reached the classifier",
+    "gesture_frames_dropped_total": "Frames replaced in a pipeline hand-off before being used",
+    "gesture_predictions_total": "Model outputs that were checked against the threshold",
+    "gesture_rejects_total": "Model outputs below the confidence threshold",
+    "gesture_detections_total": "Gestures sent to the main process",
+    "controller_errors_total": "Controller commands that failed",
+    "controller_init_seconds": "Time to create each controller at startup",
+    "controller_retries_total": "Controller API calls retried after a transient failure",
+    "circuit_breaker_transitions_total": "Controller circuit breakers opening and closing",
+    "rate_limit_wait_seconds": "Time commands queued for a client-side rate-limit token",
+    "rate_limit_shed_total": "Requests dropped because the client-side rate-limit budget was used up",
+    "dispatcher_shed_total": "Queued commands dropped because they waited too long to run",
+    "http_request_seconds": "Outbound HTTP request time until the response headers",
+    "http_responses_total": "Outbound HTTP responses by status code",
+    "lifx_lan_exchange_seconds": "LIFX LAN UDP exchange time until every bulb answered",
+}
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def data(self):
+        return self.value
+
+    def merge(self, value):
+        self.value += value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def data(self):
+        return {"buckets": self.buckets, "counts": list(self.counts), "sum": self.sum}
+
+    def merge(self, data):
+        for i, count in enumerate(data["counts"]):
+            self.counts[i] += count
+        self.sum += data["sum"]
+
+
+# Metrics keyed by name and labels, e.g. inc("controller_errors_total",
+# controller="lifx"). Safe to use from several threads.
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}  # (name, sorted label pairs) -> Counter / Histogram
+
+    def _get(self, cls, name, labels, **kwargs):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            metric = self._metrics[key] = cls(**kwargs)
+        return metric
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            self._get(Counter, name, labels).inc(amount)
+
+    def observe(self, name, seconds, **labels):
+        with self._lock:
+            self._get(Histogram, name, labels).observe(seconds)
+
+    # picklable copy of every metric; reset=True starts over from zero, so
+    # the snapshot is a delta that can be merged into another registry
+    def snapshot(self, reset=False):
+        with self._lock:
+            snapshot = [(name, labels, metric.kind, metric.data())
+                        for (name, labels), metric in self._metrics.items()]
+            if reset:
+                self._metrics = {}
+        return snapshot
+
+    def merge(self, snapshot):
+        with self._lock:
+            for name, labels, kind, data in snapshot:
+                if kind == "histogram":
+                    metric = self._get(Histogram, name, dict(labels), buckets=data["buckets"])
+                else:
+                    metric = self._get(Counter, name, dict(labels))
+                metric.merge(data)
+
+    # Prometheus text exposition format (version 0.0.4)
+    def render(self):
+        by_name = {}
+        for name, labels, kind, data in sorted(self.snapshot()):
+            by_name.setdefault(name, (kind, []))[1].append((labels, data))
+
+        lines = []
+        for name, (kind, series) in by_name.items():
+            if name in METRIC_HELP:
+                lines.append(f"# HELP {name} {METRIC_HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, data in series:
+                if kind == "counter":
+                    lines.append(f"{name}{_labels(labels)} {_number(data)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(data["buckets"] + ("+Inf",), data["counts"]):
+                    cumulative += count
+                    le = bound if bound == "+Inf" else _number(bound)
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(data['sum'])}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{value}"' for key, value in labels)
+    return "{" + pairs + "}"
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+# Registry of the main process, served by MetricsServer
+REGISTRY = Registry()
+
+
+# requests response hook recording the request time and status code of every
+# response for `backend`; pass it in a session's or request's hooks
+def http_hook(backend, registry=REGISTRY):
+    def hook(response, *args, **kwargs):
+        registry.observe("http_request_seconds", response.elapsed.total_seconds(),
+                         backend=backend)
+        registry.inc("http_responses_total", backend=backend,
+                     code=str(response.status_code))
+    return hook
+
+
+# Serves GET /metrics for a registry on a background thread
+class MetricsServer:
+    def __init__(self, registry=REGISTRY, host="127.0.0.1", port=9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.httpd = None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # scrapes every few seconds would flood the log
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]  # resolved if port was 0
+        threading.Thread(target=self.httpd.serve_forever, name="metrics",
+                         daemon=True).start()
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
@@ -0,0 +1,183 @@
+# bench_controllers.py
+# Author: Andrew Aberer
+# Load benchmark for ControllerManager against the local LIFX and Spotify
+# stand-ins (standin_servers.py), so controller throughput and latency can
+# be measured without the cloud APIs. Replays a seeded random mix of
+# gestures, switching controllers now and then, and reports commands/s,
+# latency percentiles per controller and API requests per gesture.
+#
+# Usage (from the project root):
+#   python src/test/controller/bench_controllers.py
+#   python src/test/controller/bench_controllers.py --rate 20 --latency 0.08 --jitter 0.04
+#   python src/test/controller/bench_controllers.py --error-rate 0.05 --throttle-rate 0.02
+#   python src/test/controller/bench_controllers.py --mode sync --count 50
+#   # burst against a 2 req/s stand-in limit, with and without client-side limiting
+#   python src/test/controller/bench_controllers.py --rate 0 --rate-limit 2 --rate-limit-burst 20 --client-limit 20/10
+#   python src/test/controller/bench_controllers.py --rate 0 --rate-limit 2 --rate-limit-burst 20 --client-limit off
+
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+test_dir = os.path.dirname(current_dir)
+src_dir = os.path.dirname(test_dir)
+project_root = os.path.dirname(src_dir)
+
+sys.path.insert(0, project_root)
+sys.path.insert(0, current_dir)
+
+from src.controller.controller_manager import ControllerManager
+from src.constants.constants import SPOTIFY_COMMANDS, LIFX_COMMANDS, ControllerType
+from standin_servers import LifxStandin, SpotifyStandin
+
+
+# `count` gesture indices: commands for the active controller, with a
+# switch gesture (6 = Spotify, 7 = LIFX) every `switch_every` gestures
+def gesture_script(count, switch_every, seed):
+    rng = random.Random(seed)
+    active, script = ControllerType.SPOTIFY, [6]
+    while len(script) < count:
+        if len(script) % switch_every == 0:
+            active = ControllerType.LIFX if active == ControllerType.SPOTIFY else ControllerType.SPOTIFY
+            script.append(7 if active == ControllerType.LIFX else 6)
+            continue
+        commands = SPOTIFY_COMMANDS if active == ControllerType.SPOTIFY else LIFX_COMMANDS
+        script.append(rng.choice(sorted(commands)))
+    return script
+
+
+def run_sync(manager, script):
+    records = []
+    for gesture in script:
+        controller = manager.get_active()
+        start = time.perf_counter()
+        success, info = manager.handle_gesture(gesture)
+        if info is not None and info["type"] == "switch":
+            continue
+        records.append({"controller": controller, "success": success, "shed": False, "merged": 1,
+                        "seconds": time.perf_counter() - start})
+    return records
+
+
+def run_dispatch(manager, script, rate):
+    records, submitted = [], 0
+    interval = 1.0 / rate if rate else 0.0
+    start = time.perf_counter()
+    for i, gesture in enumerate(script):
+        # hold the gesture rate, collecting whatever finished meanwhile
+        delay = start + i * interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        success, info = manager.dispatch_gesture(gesture)
+        if success and info["type"] == "queued":
+            submitted += 1
+
+    done = 0
+    while done < submitted:
+        for completion in manager.poll_completions(timeout=1.0):
+            done += completion["merged"]
+            records.append({"controller": completion["controller"],
+                            "success": completion["success"],
+                            "shed": completion["shed"],
+                            "merged": completion["merged"],
+                            "seconds": completion["queued_seconds"] + completion["run_seconds"]})
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ControllerManager load benchmark")
+    parser.add_argument("--mode", choices=["dispatch", "sync"], default="dispatch")
+    parser.add_argument("--count", type=int, default=200, help="gestures to send")
+    parser.add_argument("--rate", type=float, default=10.0,
+                        help="gestures per second in dispatch mode (0 = all at once)")
+    parser.add_argument("--switch-every", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--handshake", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, help="stand-in requests/s before 429s")
+    parser.add_argument("--rate-limit-burst", type=float,
+                        help="stand-in requests allowed at once (default: --rate-limit)")
+    parser.add_argument("--client-limit",
+                        help="client-side limit as requests/seconds, or 'off' (default: rate_limit.py)")
+    args = parser.parse_args()
+
+    faults = dict(latency=args.latency, jitter=args.jitter, handshake=args.handshake,
+                  error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                  rate_limit=args.rate_limit, rate_limit_burst=args.rate_limit_burst,
+                  seed=args.seed)
+    lifx = LifxStandin(**faults).start()
+    spotify = SpotifyStandin(**faults).start()
+
+    # point both controllers at the stand-ins, never at the real APIs
+    os.environ["LIFX_API_TOKEN"] = "standin"
+    os.environ["LIFX_API_URL"] = lifx.api_url
+    os.environ["SPOTIFY_ACCESS_TOKEN"] = "standin"
+    os.environ["SPOTIFY_API_URL"] = spotify.api_url
+    if args.client_limit:
+        os.environ["LIFX_RATE_LIMIT"] = os.environ["SPOTIFY_RATE_LIMIT"] = args.client_limit
+    logging.getLogger().setLevel(logging.WARNING)
+
+    start = time.perf_counter()
+    manager = ControllerManager()
+    startup = time.perf_counter() - start
+    readiness = manager.wait_ready()
+    ready = time.perf_counter() - start
+    time.sleep(0.2)  # let the startup state fetches finish
+    script = gesture_script(args.count, args.switch_every, args.seed)
+    requests_before = lifx.requests + spotify.requests
+
+    start = time.perf_counter()
+    if args.mode == "sync":
+        records = run_sync(manager, script)
+    else:
+        records = run_dispatch(manager, script, args.rate)
+    elapsed = time.perf_counter() - start
+    api_requests = lifx.requests + spotify.requests - requests_before
+    budgets = manager.rate_budgets()
+
+    manager.shutdown()
+    lifx.stop()
+    spotify.stop()
+
+    gestures = sum(record["merged"] for record in records)
+    print(f"\nstartup: {startup * 1000:.1f} ms to return, {ready * 1000:.1f} ms until "
+          + ", ".join(f"{name} {status}" for name, status in readiness.items()))
+    print(f"{args.mode}: {gestures} command gestures in {elapsed:.2f}s, "
+          f"latency {args.latency * 1000:.0f}+{args.jitter * 1000:.0f} ms, "
+          f"errors {args.error_rate:.0%}, 429s {args.throttle_rate:.0%}")
+    print(f"{'controller':<12}{'runs':>6}{'ok':>6}{'failed':>8}{'shed':>6}{'merged':>8}"
+          f"{'p50':>9}{'p95':>9}{'p99':>9}   (ms)")
+    for controller in (ControllerType.SPOTIFY, ControllerType.LIFX):
+        rows = [record for record in records if record["controller"] == controller]
+        if not rows:
+            continue
+        ok = sum(record["success"] for record in rows)
+        shed = sum(record["shed"] for record in rows)
+        merged = sum(record["merged"] - 1 for record in rows)
+        p50, p95, p99 = np.percentile([record["seconds"] * 1000 for record in rows], [50, 95, 99])
+        print(f"{controller:<12}{len(rows):>6}{ok:>6}{len(rows) - ok:>8}{shed:>6}{merged:>8}"
+              f"{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}")
+
+    print(f"throughput: {gestures / elapsed:.1f} gestures/s, "
+          f"{api_requests} API requests ({api_requests / max(gestures, 1):.2f} per gesture)")
+    statuses = {}
+    for standin in (lifx, spotify):
+        for status, count in standin.statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+    print(f"status codes: {dict(sorted(statuses.items()))}")
+    for name, budget in budgets.items():
+        print(f"{name} budget: {budget['remaining']}/{budget['limit']} per {budget['period']:.0f}s "
+              f"left, shed {budget['shed']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# bench_lifx_session.py
+# Author: Andrew Aberer
+# Compares LIFX command latency with a new connection per request (bare
+# requests.put, as the controller used to do) against LifxController's
+# pooled keep-alive session, using the local stand-in API.
+#
+# Usage (from the project root):
+#   python src/test/controller/bench_lifx_session.py
+#   python src/test/controller/bench_lifx_session.py --handshake 0.1 --latency 0.03 -n 50
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import requests
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+test_dir = os.path.dirname(current_dir)
+src_dir = os.path.dirname(test_dir)
+project_root = os.path.dirname(src_dir)
+
+sys.path.insert(0, project_root)
+sys.path.insert(0, current_dir)
+
+from src.controller.lifx_controller import LifxController
+from standin_servers import LifxStandin
+
+
+def timed(fn, n):
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return np.array(times) * 1000
+
+
+def report(name, times, connections):
+    p50, p95 = np.percentile(times, [50, 95])
+    print(f"{name:<22}{times.mean():>9.2f}{p50:>9.2f}{p95:>9.2f}{connections:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LIFX per-request vs pooled connections")
+    parser.add_argument("-n", type=int, default=30, help="commands per mode")
+    parser.add_argument("--handshake", type=float, default=0.05,
+                        help="stand-in delay per new connection (TCP + TLS setup)")
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="stand-in delay per request")
+    args = parser.parse_args()
+
+    os.environ.setdefault("LIFX_API_TOKEN", "standin")
+    standin = LifxStandin(latency=args.latency, handshake=args.handshake).start()
+    headers = {"Authorization": f"Bearer {os.environ['LIFX_API_TOKEN']}",
+               "Content-Type": "application/json"}
+
+    def cold():
+        response = requests.put(f"{standin.api_url}/all/state", headers=headers,
+                                json={"power": "on"})
+        response.raise_for_status()
+
+    before = standin.connections
+    cold_times = timed(cold, args.n)
+    cold_connections = standin.connections - before
+
+    controller = LifxController(api_url=standin.api_url)
+    controller.cached_lights()  # wait for the startup fetch, which warms the pool
+    before = standin.connections
+    warm_times = timed(controller.turn_on, args.n)
+    warm_connections = standin.connections - before
+    controller.close()
+    standin.stop()
+
+    print(f"\n{args.n} commands, {args.handshake * 1000:.0f} ms handshake, "
+          f"{args.latency * 1000:.0f} ms latency")
+    print(f"{'mode':<22}{'mean':>9}{'p50':>9}{'p95':>9}{'conns':>8}   (ms)")
+    report("new connection", cold_times, cold_connections)
+    report("pooled session", warm_times, warm_connections)
+    print(f"speedup: {cold_times.mean() / warm_times.mean():.2f}x")
+
+
+if __name__ == "__main__":
+    main()
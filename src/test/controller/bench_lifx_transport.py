@@ -0,0 +1,102 @@
+# bench_lifx_transport.py
+# Author: Andrew Aberer
+# Compares LIFX command latency over the cloud API (the HTTP stand-in with
+# an internet-like delay) against the LAN transport (the UDP bulb emulator),
+# running the same commands through LifxController.
+#
+# Usage (from the project root):
+#   python src/test/controller/bench_lifx_transport.py
+#   python src/test/controller/bench_lifx_transport.py --cloud-latency 0.15 --lan-latency 0.005 --loss 0.05
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+test_dir = os.path.dirname(current_dir)
+src_dir = os.path.dirname(test_dir)
+project_root = os.path.dirname(src_dir)
+
+sys.path.insert(0, project_root)
+sys.path.insert(0, current_dir)
+
+from src.controller.lifx_controller import LifxController
+from src.controller.lifx_lan import LifxLan
+from standin_servers import LifxStandin
+from lifx_lan_emulator import LanBulbEmulator
+
+COMMANDS = ["lights_on", "brightness_up", "set_color_red", "brightness_down",
+            "set_color_blue", "toggle", "toggle", "lights_off"]
+
+
+def timed_commands(controller, n):
+    times, failures = [], 0
+    for i in range(n):
+        start = time.perf_counter()
+        if not controller.execute_command(COMMANDS[i % len(COMMANDS)]):
+            failures += 1
+        times.append(time.perf_counter() - start)
+    return np.array(times) * 1000, failures
+
+
+def report(name, setup, times, failures):
+    p50, p95, p99 = np.percentile(times, [50, 95, 99])
+    print(f"{name:<8}{setup:>10.1f}{times.mean():>9.2f}{p50:>9.2f}{p95:>9.2f}{p99:>9.2f}"
+          f"{failures:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LIFX cloud API vs LAN protocol latency")
+    parser.add_argument("-n", type=int, default=80, help="commands per transport")
+    parser.add_argument("--bulbs", type=int, default=2)
+    parser.add_argument("--cloud-latency", type=float, default=0.08,
+                        help="stand-in delay per HTTP request (internet round trip)")
+    parser.add_argument("--cloud-jitter", type=float, default=0.04)
+    parser.add_argument("--lan-latency", type=float, default=0.002,
+                        help="emulator delay per UDP reply (Wi-Fi round trip)")
+    parser.add_argument("--loss", type=float, default=0.0, help="share of UDP packets dropped")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    os.environ.setdefault("LIFX_API_TOKEN", "standin")
+    standin = LifxStandin(num_lights=args.bulbs, latency=args.cloud_latency,
+                          jitter=args.cloud_jitter).start()
+    emulator = LanBulbEmulator(args.bulbs, latency=args.lan_latency, loss=args.loss).start()
+
+    # setup = until the lights are known: the first GET for the cloud,
+    # discovery for the LAN (the constructor starts it in the background)
+    start = time.perf_counter()
+    cloud = LifxController(api_url=standin.api_url, transport="cloud")
+    cloud.cached_lights()
+    cloud_setup = (time.perf_counter() - start) * 1000
+    cloud_times, cloud_failures = timed_commands(cloud, args.n)
+    cloud_requests = standin.requests
+    cloud.close()
+
+    start = time.perf_counter()
+    lan = LifxController(transport="lan", lan=LifxLan(broadcast=emulator.address))
+    lan.cached_lights()
+    lan_setup = (time.perf_counter() - start) * 1000
+    lan_times, lan_failures = timed_commands(lan, args.n)
+    lan.close()
+
+    standin.stop()
+    emulator.stop()
+
+    print(f"\n{args.n} commands on {args.bulbs} lights, cloud {args.cloud_latency * 1000:.0f}"
+          f"+{args.cloud_jitter * 1000:.0f} ms, LAN {args.lan_latency * 1000:.1f} ms, "
+          f"{args.loss:.0%} UDP loss")
+    print(f"{'mode':<8}{'setup':>10}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'failed':>8}   (ms)")
+    report("cloud", cloud_setup, cloud_times, cloud_failures)
+    report("lan", lan_setup, lan_times, lan_failures)
+    print(f"cloud requests: {cloud_requests}, LAN packets: {emulator.packets} "
+          f"({emulator.dropped} dropped)")
+    print(f"speedup: {cloud_times.mean() / lan_times.mean():.1f}x")
+
+
+if __name__ == "__main__":
+    main()
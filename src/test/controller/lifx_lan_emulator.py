@@ -0,0 +1,136 @@
+# lifx_lan_emulator.py
+# Author: Andrew Aberer
+# Local stand-in for LIFX bulbs speaking the LAN protocol, so the LAN
+# transport (controller/lifx_lan.py) can be run and benchmarked without real
+# bulbs. One UDP socket answers for every emulated bulb: discovery gets one
+# StateService per bulb, other messages are routed by their target serial.
+# It can inject:
+#   latency   delay before each reply
+#   loss      share of incoming packets dropped (to exercise resends)
+#
+# Usage (from the project root):
+#   python src/test/controller/lifx_lan_emulator.py --bulbs 3 --latency 0.002
+#   LIFX_TRANSPORT=lan LIFX_LAN_BROADCAST=127.0.0.1:56700 python src/test/controller/test_lifx.py
+
+import argparse
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+test_dir = os.path.dirname(current_dir)
+src_dir = os.path.dirname(test_dir)
+project_root = os.path.dirname(src_dir)
+
+sys.path.insert(0, project_root)
+
+from src.controller.lifx_lan import (
+    pack_message, unpack_message, to_hsbk,
+    GET_SERVICE, STATE_SERVICE, ACKNOWLEDGEMENT, LIGHT_GET, LIGHT_SET_COLOR,
+    LIGHT_STATE, LIGHT_SET_POWER, SERVICE_UDP, RES_REQUIRED, ACK_REQUIRED,
+    STATE_SERVICE_PAYLOAD, LIGHT_STATE_PAYLOAD, SET_COLOR_PAYLOAD, SET_POWER_PAYLOAD
+)
+
+
+class LanBulbEmulator:
+    def __init__(self, num_bulbs=2, host="127.0.0.1", port=0, latency=0.0, loss=0.0, seed=0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.bulbs = {bytes.fromhex(f"d073d5{i:06x}"): {
+            "label": f"Light {i + 1}",
+            "power": 65535,
+            "hsbk": to_hsbk(0.0, 0.0, 0.5, 3500)
+        } for i in range(num_bulbs)}
+        self.packets = 0  # packets received so far
+        self.dropped = 0  # of which dropped on purpose
+        self.sock = None
+        self.running = False
+
+    @property
+    def address(self):
+        return f"{self.host}:{self.port}"
+
+    # (reply type, payload) pairs for one message to one bulb
+    def handle(self, msg_type, bulb, payload):
+        if msg_type == GET_SERVICE:
+            return [(STATE_SERVICE, STATE_SERVICE_PAYLOAD.pack(SERVICE_UDP, self.port))]
+        if msg_type == LIGHT_SET_COLOR:
+            _, *hsbk, _ = SET_COLOR_PAYLOAD.unpack(payload)
+            bulb["hsbk"] = tuple(hsbk)
+        elif msg_type == LIGHT_SET_POWER:
+            bulb["power"] = SET_POWER_PAYLOAD.unpack(payload)[0]
+        if msg_type in (LIGHT_GET, LIGHT_SET_COLOR, LIGHT_SET_POWER):
+            return [(LIGHT_STATE, LIGHT_STATE_PAYLOAD.pack(
+                *bulb["hsbk"], 0, bulb["power"], bulb["label"].encode().ljust(32, b"\0"), 0))]
+        return []
+
+    def _serve(self):
+        while self.running:
+            try:
+                data, addr = self.sock.recvfrom(1024)
+            except OSError:
+                return
+            self.packets += 1
+            if self.loss and self.random.random() < self.loss:
+                self.dropped += 1
+                continue
+            msg_type, source, target, sequence, flags, payload = unpack_message(data)
+            broadcast = not any(target)
+            if self.latency:
+                time.sleep(self.latency)
+
+            for serial, bulb in self.bulbs.items():
+                if not broadcast and serial != target:
+                    continue
+                replies = self.handle(msg_type, bulb, payload)
+                if flags & ACK_REQUIRED:
+                    self.sock.sendto(pack_message(ACKNOWLEDGEMENT, b"", source, serial,
+                                                  sequence), addr)
+                if flags & RES_REQUIRED or msg_type == GET_SERVICE:
+                    for reply_type, reply in replies:
+                        self.sock.sendto(pack_message(reply_type, reply, source, serial,
+                                                      sequence), addr)
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((self.host, self.port))
+        self.port = self.sock.getsockname()[1]
+        self.running = True
+        threading.Thread(target=self._serve, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local LIFX LAN bulb emulator")
+    parser.add_argument("--port", type=int, default=56700)
+    parser.add_argument("--bulbs", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds added before every reply")
+    parser.add_argument("--loss", type=float, default=0.0,
+                        help="share of packets dropped")
+    args = parser.parse_args()
+
+    emulator = LanBulbEmulator(args.bulbs, port=args.port, latency=args.latency,
+                               loss=args.loss).start()
+    print(f"{args.bulbs} emulated bulbs: LIFX_TRANSPORT=lan LIFX_LAN_BROADCAST={emulator.address}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        emulator.stop()
+
+
+if __name__ == "__main__":
+    main()
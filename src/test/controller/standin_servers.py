@@ -0,0 +1,331 @@
+# standin_servers.py
+# Author: Andrew Aberer
+# Local stand-ins for the cloud APIs the controllers talk to, so commands
+# can be benchmarked without real bulbs, accounts or internet. Each server
+# runs on a background thread and can inject:
+#   handshake    delay per new connection (the TCP + TLS setup to a remote API)
+#   latency      delay per request, plus up to `jitter` more at random
+#   error_rate   share of requests answered with 500
+#   throttle_rate  share of requests answered with 429 + Retry-After
+#   rate_limit   requests per second allowed (burst of rate_limit_burst);
+#                beyond it requests get 429 + Retry-After, like the real APIs
+#
+# Usage (from the project root):
+#   python src/test/controller/standin_servers.py --latency 0.05 --jitter 0.02
+#   LIFX_API_URL=http://127.0.0.1:8081/v1/lights python src/test/controller/test_lifx.py
+#   SPOTIFY_API_URL=http://127.0.0.1:8082/v1/ SPOTIFY_ACCESS_TOKEN=standin \
+#       python src/test/controller/test_spotify.py
+
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StandinServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, handshake=0.0,
+                 jitter=0.0, error_rate=0.0, throttle_rate=0.0, retry_after=1,
+                 rate_limit=None, rate_limit_burst=None, seed=0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.handshake = handshake
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after  # seconds, sent with every injected 429
+        self.rate_limit = rate_limit
+        self.rate_limit_burst = rate_limit_burst or rate_limit
+        self.random = random.Random(seed)
+        self.connections = 0  # connections accepted so far
+        self.requests = 0     # requests answered so far
+        self.statuses = {}    # status code -> responses sent
+        self.lock = threading.Lock()
+        self.httpd = None
+        self._tokens = self.rate_limit_burst or 0
+        self._refilled_at = time.monotonic()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    # (status, JSON-able body or None) for one request; overridden per API
+    def handle(self, method, path, headers, body):
+        return 404, {"error": "not found"}
+
+    # error body in the API's own format
+    def error(self, status, message):
+        return {"error": message}
+
+    # injected failure for this request as (status, body, headers), or None
+    def fault(self):
+        with self.lock:
+            if self.rate_limit:
+                now = time.monotonic()
+                self._tokens = min(self.rate_limit_burst,
+                                   self._tokens + (now - self._refilled_at) * self.rate_limit)
+                self._refilled_at = now
+                if self._tokens < 1:
+                    wait = max(1, int((1 - self._tokens) / self.rate_limit + 0.999))
+                    return 429, self.error(429, "rate limited"), {"Retry-After": str(wait)}
+                self._tokens -= 1
+            roll = self.random.random()
+        if roll < self.throttle_rate:
+            return 429, self.error(429, "rate limited"), {"Retry-After": str(self.retry_after)}
+        if roll < self.throttle_rate + self.error_rate:
+            return 500, self.error(500, "injected failure"), {}
+        return None
+
+    # headers describing the remaining rate-limit budget, if there is a limit
+    def rate_headers(self):
+        if not self.rate_limit:
+            return {}
+        return {"X-RateLimit-Limit": str(self.rate_limit_burst),
+                "X-RateLimit-Remaining": str(max(0, int(self._tokens)))}
+
+    def start(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+
+            def setup(self):
+                super().setup()
+                # headers and body are separate writes; without this, Nagle
+                # plus delayed ACKs add ~40 ms to every keep-alive response
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with standin.lock:
+                    standin.connections += 1
+                if standin.handshake:
+                    time.sleep(standin.handshake)
+
+            def _serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                body = json.loads(raw) if raw else None
+                delay = standin.latency
+                if standin.jitter:
+                    with standin.lock:
+                        delay += standin.random.uniform(0, standin.jitter)
+                if delay:
+                    time.sleep(delay)
+
+                extra = {}
+                fault = standin.fault()
+                if fault is not None:
+                    status, payload, extra = fault
+                else:
+                    status, payload = standin.handle(self.command, self.path,
+                                                     self.headers, body)
+                extra.update(standin.rate_headers())
+                data = json.dumps(payload).encode() if payload is not None else b""
+                with standin.lock:
+                    standin.requests += 1
+                    standin.statuses[status] = standin.statuses.get(status, 0) + 1
+
+                self.send_response(status)
+                if data:
+                    self.send_header("Content-Type", "application/json")
+                for name, value in extra.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_PUT = do_POST = do_DELETE = _serve
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+
+# The parts of the LIFX HTTP API (https://api.lifx.com/v1/lights) that
+# LifxController uses: list lights, set state, set states, toggle
+class LifxStandin(StandinServer):
+    def __init__(self, num_lights=2, **kwargs):
+        super().__init__(**kwargs)
+        self.lights = [{
+            "id": f"d073d5{i:06x}",
+            "label": f"Light {i + 1}",
+            "power": "on",
+            "brightness": 0.5,
+            "color": {"hue": 0.0, "saturation": 0.0, "kelvin": 3500},
+            "connected": True
+        } for i in range(num_lights)]
+
+    @property
+    def api_url(self):
+        return self.url + "/v1/lights"
+
+    def select(self, selector):
+        if selector == "all":
+            return self.lights
+        kind, _, value = selector.partition(":")
+        return [light for light in self.lights if light.get(kind) == value]
+
+    def handle(self, method, path, headers, body):
+        if not (headers.get("Authorization") or "").startswith("Bearer "):
+            return 401, {"error": "Bad token"}
+
+        parts = path.split("?")[0].strip("/").split("/")
+        if parts[:2] != ["v1", "lights"] or len(parts) < 3:
+            return 404, {"error": "not found"}
+
+        with self.lock:
+            if method == "PUT" and parts[2:] == ["states"]:
+                return 207, self.set_states(body or {})
+            lights = self.select(parts[2])
+            if method == "GET" and len(parts) == 3:
+                return 200, lights
+            if method == "PUT" and parts[3:] == ["state"]:
+                for light in lights:
+                    self.apply_state(light, body or {})
+                return 207, self.results(lights)
+            if method == "POST" and parts[3:] == ["toggle"]:
+                for light in lights:
+                    light["power"] = "off" if light["power"] == "on" else "on"
+                return 207, self.results(lights)
+        return 404, {"error": "not found"}
+
+    def apply_state(self, light, state):
+        if "power" in state:
+            light["power"] = state["power"]
+        if "brightness" in state:
+            light["brightness"] = max(0.0, min(1.0, float(state["brightness"])))
+        if "color" in state:
+            light["color"] = state["color"]
+
+    # PUT /lights/states: each state with "defaults" filling in what it
+    # leaves out, results grouped per operation
+    def set_states(self, body):
+        results = []
+        for state in body.get("states", []):
+            operation = dict(body.get("defaults") or {}, **state)
+            lights = self.select(operation.get("selector", "all"))
+            for light in lights:
+                self.apply_state(light, operation)
+            results.append({"operation": state, **self.results(lights)})
+        return {"results": results}
+
+    def results(self, lights):
+        return {"results": [{"id": light["id"], "label": light["label"], "status": "ok"}
+                            for light in lights]}
+
+
+# The player and library endpoints of the Spotify Web API
+# (https://api.spotify.com/v1/) that SpotifyController uses
+class SpotifyStandin(StandinServer):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.tracks = [{
+            "id": f"track{i}",
+            "uri": f"spotify:track:track{i}",
+            "name": f"Track {i + 1}",
+            "artists": [{"name": "Stand-in Artist"}]
+        } for i in range(5)]
+        self.position = 0
+        self.is_playing = True
+        self.shuffle = False
+        self.volume = 50
+        self.saved = set()
+
+    @property
+    def api_url(self):
+        return self.url + "/v1/"
+
+    def error(self, status, message):
+        return {"error": {"status": status, "message": message}}
+
+    def playback(self):
+        return {
+            "device": {"id": "standin", "name": "Stand-in", "volume_percent": self.volume},
+            "shuffle_state": self.shuffle,
+            "is_playing": self.is_playing,
+            "item": self.tracks[self.position]
+        }
+
+    def handle(self, method, path, headers, body):
+        if not (headers.get("Authorization") or "").startswith("Bearer "):
+            return 401, self.error(401, "No token provided")
+
+        route, _, query = path.partition("?")
+        params = dict(pair.partition("=")[::2] for pair in query.split("&") if pair)
+        route = route.rstrip("/")
+
+        with self.lock:
+            if method == "GET" and route in ("/v1/me/player", "/v1/me/player/currently-playing"):
+                return 200, self.playback()
+            if method == "PUT" and route == "/v1/me/player/play":
+                self.is_playing = True
+                return 204, None
+            if method == "PUT" and route == "/v1/me/player/pause":
+                self.is_playing = False
+                return 204, None
+            if method == "POST" and route == "/v1/me/player/next":
+                self.position = (self.position + 1) % len(self.tracks)
+                return 204, None
+            if method == "POST" and route == "/v1/me/player/previous":
+                self.position = (self.position - 1) % len(self.tracks)
+                return 204, None
+            if method == "PUT" and route == "/v1/me/player/volume":
+                self.volume = max(0, min(100, int(params.get("volume_percent", self.volume))))
+                return 204, None
+            if method == "PUT" and route == "/v1/me/player/shuffle":
+                self.shuffle = params.get("state") == "true"
+                return 204, None
+            if method == "PUT" and route in ("/v1/me/library", "/v1/me/tracks"):
+                ids = params.get("uris") or params.get("ids") or ""
+                self.saved.update(item for item in ids.replace("%3A", ":").split(",") if item)
+                return 200, None
+        return 404, self.error(404, "Service not found")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in API servers")
+    parser.add_argument("--lifx-port", type=int, default=8081)
+    parser.add_argument("--spotify-port", type=int, default=8082)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="up to this many seconds added at random")
+    parser.add_argument("--handshake", type=float, default=0.0,
+                        help="seconds added to every new connection")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="share of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0,
+                        help="share of requests answered with 429")
+    parser.add_argument("--rate-limit", type=float,
+                        help="requests per second before answering 429")
+    args = parser.parse_args()
+
+    faults = dict(latency=args.latency, jitter=args.jitter, handshake=args.handshake,
+                  error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                  rate_limit=args.rate_limit)
+    lifx = LifxStandin(port=args.lifx_port, **faults).start()
+    spotify = SpotifyStandin(port=args.spotify_port, **faults).start()
+    print(f"LIFX stand-in:    {lifx.api_url}")
+    print(f"Spotify stand-in: {spotify.api_url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        lifx.stop()
+        spotify.stop()
+
+
+if __name__ == "__main__":
+    main()
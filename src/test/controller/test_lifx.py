@@ -52,7 +52,8 @@ def print_available_commands():
 
     print("-" * 50)
     print("Enter command index, gesture name, or command name")
-    print("Type 'list' to show commands again, 'state' for light status, or 'q' to quit")
+    print("Type 'list' to show commands again, 'state' for light status, 'scene' for a")
+    print("batched red/blue scene across the lights, or 'q' to quit")
 
 
 def initialize_lifx():
@@ -132,6 +133,21 @@ def get_light_states(lifx):
         print(f"Error getting light states: {str(e)}")
 
 
+# alternate lights red / blue, sent as a single set_states request
+def run_scene(lifx):
+    try:
+        lights = lifx.get_lights()
+        states = [{"selector": f"id:{light['id']}", "power": "on",
+                   "color": "red" if i % 2 == 0 else "blue"}
+                  for i, light in enumerate(lights)]
+        results = lifx.set_states(states, defaults={"duration": 1.0})
+        for result in results:
+            for light in result["results"]:
+                print(f"{light['label']}: {result['operation']['color']} - {light['status']}")
+    except Exception as e:
+        print(f"Error setting scene: {str(e)}")
+
+
 def main():
     print("=" * 50)
     print("LIFX Controller Test Script")
@@ -161,6 +177,9 @@ def main():
             elif command_input == 'state':
                 get_light_states(lifx)
                 continue
+            elif command_input == 'scene':
+                run_scene(lifx)
+                continue
 
             process_command(lifx, command_input)
 
@@ -0,0 +1,57 @@
+# bench_headless.py
+# Author: Caden Calderon
+# Runs the live recognizer on the camera for a fixed time, windowed and
+# headless, and compares the frame rates each mode sustains.
+#
+# Usage (from the project root):
+#   python src/test/gestures/bench_headless.py
+#   python src/test/gestures/bench_headless.py --seconds 30 --modes headless
+
+import argparse
+import os
+import queue
+import sys
+import threading
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+test_dir = os.path.dirname(current_dir)
+src_dir = os.path.dirname(test_dir)
+project_root = os.path.dirname(src_dir)
+
+sys.path.insert(0, project_root)
+
+from src.gestures.predict_gestures import run_gesture_recognition
+
+
+def run_for(seconds, headless):
+    stop = threading.Event()
+    timer = threading.Timer(seconds, stop.set)
+    timer.start()
+    try:
+        return run_gesture_recognition(queue.Queue(), stop, headless=headless)
+    finally:
+        timer.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Windowed vs headless frame rate")
+    parser.add_argument("--seconds", type=float, default=15.0)
+    parser.add_argument("--modes", nargs="+", default=["windowed", "headless"],
+                        choices=["windowed", "headless"])
+    args = parser.parse_args()
+
+    results = {}
+    for mode in args.modes:
+        print(f"Running {mode} for {args.seconds:.0f}s...")
+        results[mode] = run_for(args.seconds, headless=(mode == "headless"))
+
+    print("\n===== FRAME RATE =====")
+    for mode, stats in results.items():
+        print(f"{mode:<10} {stats['frames']:>6} frames  {stats['fps']:>6.1f} fps")
+    if len(results) == 2 and results["windowed"]["fps"] > 0:
+        gain = results["headless"]["fps"] / results["windowed"]["fps"] - 1
+        print(f"headless is {gain:+.0%} vs windowed")
+
+
+if __name__ == "__main__":
+    main()
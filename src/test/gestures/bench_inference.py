@@ -0,0 +1,81 @@
+# bench_inference.py
+# Author: Caden Calderon
+# Micro-benchmark of per-call latency for a single (1, 20, 63) window:
+# the old model.predict path vs. eager model(x) vs. the compiled
+# KerasBackend path (and any exported TFLite models that exist).
+#
+# Usage (from the project root):
+#   python src/test/gestures/bench_inference.py
+#   python src/test/gestures/bench_inference.py --calls 500
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+test_dir = os.path.dirname(current_dir)
+src_dir = os.path.dirname(test_dir)
+project_root = os.path.dirname(src_dir)
+
+sys.path.insert(0, project_root)
+
+from src.gestures.inference import KerasBackend, TFLiteBackend
+
+MODEL_PATH = "best_gesture_lstm.h5"
+TFLITE_PATHS = ["gesture_lstm_float16.tflite", "gesture_lstm_int8.tflite"]
+
+
+def time_calls(fn, x, calls, warmup=5):
+    for _ in range(warmup):
+        fn(x)
+    times = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn(x)
+        times.append(time.perf_counter() - start)
+    return 1000 * np.array(times)
+
+
+def report(name, times_ms, baseline_ms=None):
+    p50, p95 = np.percentile(times_ms, [50, 95])
+    speedup = f"{baseline_ms / p50:>8.1f}x" if baseline_ms else f"{'-':>9}"
+    print(f"{name:<46}{p50:>9.2f}{p95:>9.2f}{speedup}")
+    return p50
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gesture LSTM inference latency")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(1, 20, 63)).astype(np.float32)
+
+    backend = KerasBackend(args.model)
+    backend.warmup()
+    model = backend.model
+
+    print(f"\nPer-call latency over {args.calls} calls (ms)")
+    print("-" * 73)
+    print(f"{'path':<46}{'p50':>9}{'p95':>9}{'speedup':>9}")
+    baseline = report("model.predict(x)",
+                      time_calls(lambda v: model.predict(v, verbose=0), x, args.calls))
+    report("model(x, training=False)",
+           time_calls(lambda v: model(v, training=False), x, args.calls), baseline)
+    report("KerasBackend (tf.function)",
+           time_calls(backend.predict_proba, x, args.calls), baseline)
+    for path in TFLITE_PATHS:
+        if os.path.exists(path):
+            tflite = TFLiteBackend(path)
+            tflite.warmup()
+            report(f"TFLiteBackend ({path})",
+                   time_calls(tflite.predict_proba, x, args.calls), baseline)
+    print("-" * 73)
+
+
+if __name__ == "__main__":
+    main()
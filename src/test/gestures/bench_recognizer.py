@@ -0,0 +1,135 @@
+# bench_recognizer.py
+# Author: Caden Calderon
+# End-to-end benchmark of the recognizer without a camera. Replays stored
+# landmark sequences (or a recorded video) through run_gesture_recognition
+# and reports frames/s, per-step latency percentiles and, for landmark
+# replays, how many of the replayed gestures were detected correctly.
+#
+# Usage (from the project root, after `python src/gestures/dataset.py`):
+#   python src/test/gestures/bench_recognizer.py
+#   python src/test/gestures/bench_recognizer.py --limit 100 --backend tflite
+#   python src/test/gestures/bench_recognizer.py --threaded --limit 50
+#   python src/test/gestures/bench_recognizer.py --video clip.mp4
+
+import argparse
+import os
+import queue
+import sys
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+test_dir = os.path.dirname(current_dir)
+src_dir = os.path.dirname(test_dir)
+project_root = os.path.dirname(src_dir)
+
+sys.path.insert(0, project_root)
+
+from src.gestures.predict_gestures import Config, gesture_list, run_gesture_recognition
+from src.gestures.sources import LandmarkReplaySource, VideoFileSource
+
+STEPS = ["capture", "mediapipe", "preprocess", "predict", "classify", "total"]
+
+
+# first detection inside each replayed gesture's time span decides whether
+# it was recognized; anything else counts as an extra detection
+def score(events, detections):
+    correct, wrong, extra = 0, 0, 0
+    per_class = {}
+    times = np.array([d["timestamp"] for d in detections])
+    for start, end, label in events:
+        hits = [d for d, t in zip(detections, times) if start <= t < end]
+        total, ok = per_class.get(label, (0, 0))
+        if hits and hits[0]["gesture_index"] == label:
+            correct += 1
+            ok += 1
+        elif hits:
+            wrong += 1
+        extra += max(len(hits) - 1, 0)
+        per_class[label] = (total + 1, ok)
+
+    first_start = events[0][0] if events else 0.0
+    extra += int(np.sum(times < first_start))
+    return {
+        "events": len(events),
+        "correct": correct,
+        "wrong": wrong,
+        "missed": len(events) - correct - wrong,
+        "extra": extra,
+        "accuracy": correct / len(events) if events else 0.0,
+        "per_class": per_class,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline recognizer benchmark")
+    parser.add_argument("--video", help="replay this video instead of landmark sequences")
+    parser.add_argument("--partition", default="test", choices=["train", "validate", "test"])
+    parser.add_argument("--limit", type=int, help="replay at most this many sequences")
+    parser.add_argument("--gap", type=int, default=30, help="no-hand frames between sequences")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", choices=["keras", "tflite"], default=Config.INFERENCE_BACKEND)
+    parser.add_argument("--streaming", action="store_true")
+    parser.add_argument("--threaded", action="store_true",
+                        help="run the threaded pipeline (implies --realtime)")
+    parser.add_argument("--realtime", action="store_true",
+                        help="pace the source at its frame rate instead of as fast as possible")
+    args = parser.parse_args()
+    # unpaced, the threaded stages would only see the newest of many frames
+    # and the source would run dry before they caught up
+    realtime = args.realtime or args.threaded
+
+    cfg = Config()
+    cfg.INFERENCE_BACKEND = args.backend
+    cfg.STREAMING = args.streaming
+    cfg.THREADED = args.threaded
+    cfg.STATS_INTERVAL = 0
+    cfg.METRICS_INTERVAL = 0  # timings are collected below instead
+
+    if args.video:
+        source = VideoFileSource(args.video, realtime=realtime)
+    else:
+        source = LandmarkReplaySource.from_pack(args.partition, limit=args.limit,
+                                                seed=args.seed, gap=args.gap,
+                                                realtime=realtime)
+
+    timings = {step: [] for step in STEPS}
+
+    def on_packet(packet):
+        for step, seconds in packet.timings.items():
+            timings[step].append(seconds)
+
+    results = queue.Queue()
+    stats = run_gesture_recognition(results, headless=True, source=source,
+                                    cfg=cfg, on_packet=on_packet)
+    detections = []
+    while not results.empty():
+        detections.append(results.get())
+
+    print("\n===== THROUGHPUT =====")
+    print(f"{stats['frames']} frames in {stats['seconds']:.2f}s = {stats['fps']:.1f} fps")
+
+    print("\n===== LATENCY (ms) =====")
+    print(f"{'step':<12}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for step in STEPS:
+        if not timings[step]:
+            continue
+        p50, p95, p99 = np.percentile(np.array(timings[step]) * 1000, [50, 95, 99])
+        print(f"{step:<12}{len(timings[step]):>8}{p50:>10.3f}{p95:>10.3f}{p99:>10.3f}")
+
+    print(f"\n{len(detections)} gestures detected")
+    events = getattr(source, "events", None)
+    if not events:
+        return
+
+    report = score(events, detections)
+    print("\n===== ACCURACY =====")
+    print(f"{report['correct']}/{report['events']} correct ({report['accuracy']:.2%}), "
+          f"{report['wrong']} wrong, {report['missed']} missed, {report['extra']} extra")
+    for label in sorted(report["per_class"]):
+        total, ok = report["per_class"][label]
+        print(f"  {gesture_list[label]:<16}{ok:>4}/{total:<4}")
+
+
+if __name__ == "__main__":
+    main()